@@ -0,0 +1,423 @@
+"""Bulk import of historical exchange rates from CSV or Parquet dumps straight into SQLite."""
+import csv
+import itertools
+import logging
+import sqlite3
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Annotated, Any, Optional
+
+import numpy as np
+import typer
+
+from currensee import delta, rollups
+from currensee.config import get_settings
+from currensee.constants import BASE_CURRENCY, DATE, DEFAULT_BASE_CURRENCY, RATE, TARGET_CURRENCY
+from currensee.logging_config import setup_logging
+from currensee.transform_load import EXCHANGE_RATES_INDEXES, init_database
+
+setup_logging()
+logger = logging.getLogger('currensee.bulk_import')
+app = typer.Typer()
+
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMATS = (FORMAT_CSV, FORMAT_PARQUET)
+
+# long: one (date, base, target, rate) row per record, wide: a date column and one column per currency
+LAYOUT_LONG = 'long'
+LAYOUT_WIDE = 'wide'
+LAYOUTS = (LAYOUT_LONG, LAYOUT_WIDE)
+
+# Column names used by common provider exports, matched case-insensitively
+COLUMN_ALIASES = {
+    DATE: ('date', 'day', 'time', 'timestamp', 'record_date', 'as_of', 'time_period'),
+    BASE_CURRENCY: ('base_currency', 'base', 'from', 'source', 'base_ccy'),
+    TARGET_CURRENCY: ('target_currency', 'target', 'currency', 'to', 'quote', 'quote_currency', 'symbol', 'ccy'),
+    RATE: ('rate', 'value', 'close', 'price', 'exchange_rate', 'fx_rate', 'obs_value'),
+}
+
+# Cells of wide exports that mean "no rate for this currency on this day" rather than bad data
+MISSING_VALUES = ('', 'na', 'n/a', 'nan', 'null', 'none', '-')
+
+# Trade durability for speed, a failed import is rolled back and simply re-run. No exclusive locking mode,
+# readers must keep working during an import.
+BULK_PRAGMAS = (
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -262144',
+)
+
+CURRENCY_CODE_LENGTH = 3
+
+# First and last year of a plausible rate date, anything else is a parsing accident
+VALID_YEARS = (1900, 2100)
+
+Chunk = dict[str, np.ndarray]
+
+
+@dataclass
+class ImportOptions:
+    file_format: str | None = None
+    layout: str = LAYOUT_LONG
+    base_currency: str = DEFAULT_BASE_CURRENCY
+    column_map: dict[str, str] = field(default_factory=dict)
+    chunk_size: int = 200_000
+    strict: bool = False
+    dry_run: bool = False
+    force_overwrite: bool = False
+
+
+@dataclass
+class ImportStats:
+    rows_read: int = 0
+    rows_invalid: int = 0
+    rows_loaded: int = 0
+    date_from: str | None = None
+    date_to: str | None = None
+
+
+def read_chunks(path: Path, file_format: str, chunk_size: int) -> Iterator[Chunk]:
+    """Stream a dump as column arrays of at most `chunk_size` rows."""
+    if file_format == FORMAT_PARQUET:
+        yield from _read_parquet(path, chunk_size)
+    else:
+        yield from _read_csv(path, chunk_size)
+
+
+def _read_csv(path: Path, chunk_size: int) -> Iterator[Chunk]:
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        while rows := list(itertools.islice(reader, chunk_size)):
+            # zip_longest keeps the columns aligned if some rows are short
+            columns = itertools.zip_longest(*rows, fillvalue='')
+            yield {name: np.array(values, dtype=object) for name, values in zip(header, columns, strict=False)}
+
+
+def _read_parquet(path: Path, chunk_size: int) -> Iterator[Chunk]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ValueError('Reading Parquet files requires pyarrow, install it with `poetry install -E parquet`') from e
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        yield {name: batch.column(i).to_numpy(zero_copy_only=False) for i, name in enumerate(batch.schema.names)}
+
+
+def resolve_columns(columns: list[str], options: ImportOptions) -> dict[str, str]:
+    """Map record fields to the dump's column names, explicit `column_map` entries win over aliases."""
+    by_lower = {name.strip().lower(): name for name in columns}
+    resolved: dict[str, str] = {}
+
+    for record_field, aliases in COLUMN_ALIASES.items():
+        if record_field in options.column_map:
+            source = options.column_map[record_field]
+            if source not in columns:
+                raise ValueError(f'Column {source!r} mapped to {record_field} not found in {columns}')
+            resolved[record_field] = source
+            continue
+        match = next((by_lower[alias] for alias in aliases if alias in by_lower), None)
+        if match is not None:
+            resolved[record_field] = match
+
+    required = (DATE,) if options.layout == LAYOUT_WIDE else (DATE, TARGET_CURRENCY, RATE)
+    missing = [name for name in required if name not in resolved]
+    if missing:
+        raise ValueError(f'Cannot find column(s) for {", ".join(missing)} in {columns}, use --column to map them')
+    return resolved
+
+
+def _to_long(chunk: Chunk, columns: dict[str, str], options: ImportOptions) -> Chunk:
+    """Bring a chunk to (date, base, target, rate) columns, melting wide layouts."""
+    dates = chunk[columns[DATE]]
+
+    if options.layout == LAYOUT_WIDE:
+        currency_columns = [name for name in chunk if name != columns[DATE]]
+        values = np.stack([chunk[name] for name in currency_columns], axis=1).ravel()
+        long_chunk = {
+            DATE: np.repeat(dates, len(currency_columns)),
+            TARGET_CURRENCY: np.tile(np.array(currency_columns, dtype=object), len(dates)),
+            RATE: values,
+        }
+        present = ~np.isin(np.char.lower(np.char.strip(values.astype(str))), MISSING_VALUES)
+        long_chunk = {name: column[present] for name, column in long_chunk.items()}
+    else:
+        long_chunk = {DATE: dates, TARGET_CURRENCY: chunk[columns[TARGET_CURRENCY]], RATE: chunk[columns[RATE]]}
+
+    if BASE_CURRENCY in columns and options.layout == LAYOUT_LONG:
+        long_chunk[BASE_CURRENCY] = chunk[columns[BASE_CURRENCY]]
+    else:
+        long_chunk[BASE_CURRENCY] = np.full(len(long_chunk[DATE]), options.base_currency, dtype=object)
+    return long_chunk
+
+
+def _parse_rates(values: np.ndarray) -> np.ndarray:
+    try:
+        return np.asarray(values).astype(np.float64)
+    except (TypeError, ValueError):
+        # Slow path, only taken by chunks that contain unparseable values
+        return np.fromiter((_float_or_nan(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def _float_or_nan(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _parse_dates(values: np.ndarray) -> np.ndarray:
+    """Parse dates to datetime64[D], invalid ones become NaT.
+
+    Strings must start with a `YYYY-MM-DD` date, optionally followed by a time which is dropped. Numeric
+    columns are epoch seconds (e.g. a `timestamp` export). Dates outside `VALID_YEARS` are invalid.
+    """
+    if np.issubdtype(values.dtype, np.datetime64):
+        dates = values.astype('datetime64[D]')
+    elif np.issubdtype(values.dtype, np.number):
+        dates = values.astype('datetime64[s]').astype('datetime64[D]')
+    else:
+        dates = _parse_date_strings(np.char.strip(values.astype(str)))
+
+    first_year, last_year = VALID_YEARS
+    in_range = (dates >= np.datetime64(f'{first_year}-01-01')) & (dates <= np.datetime64(f'{last_year}-12-31'))
+    return np.where(in_range, dates, np.datetime64('NaT'))
+
+
+def _parse_date_strings(strings: np.ndarray) -> np.ndarray:
+    # numpy reads any run of digits as a year, so check the YYYY-MM-DD shape character by character first
+    chars = strings.astype('U11').view('U1').reshape(-1, 11)
+    digits = np.char.isdigit(chars[:, [0, 1, 2, 3, 5, 6, 8, 9]]).all(axis=1)
+    separators = (chars[:, 4] == '-') & (chars[:, 7] == '-') & np.isin(chars[:, 10], ('', ' ', 'T'))
+    day_strings = np.where(digits & separators, strings.astype('U10'), 'NaT')
+    try:
+        return day_strings.astype('datetime64[D]')
+    except ValueError:
+        # Well-shaped but impossible dates, like 2024-13-01
+        return np.array([_date_or_nat(v) for v in day_strings], dtype='datetime64[D]')
+
+
+def _date_or_nat(value: str) -> np.datetime64:
+    try:
+        return np.datetime64(value, 'D')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def _normalize_currencies(values: np.ndarray) -> np.ndarray:
+    return np.char.upper(np.char.strip(values.astype(str)))
+
+
+def validate_chunk(chunk: Chunk) -> tuple[list[tuple[str, str, float, str]], int]:
+    """Validate a long chunk column-wise and return the valid rows plus the number of invalid ones.
+
+    This is the vectorized equivalent of `ExchangeRateRecord.model_validate`: 3-letter currency codes, a
+    parseable date and a finite, positive rate.
+    """
+    rates = _parse_rates(chunk[RATE])
+    dates = _parse_dates(chunk[DATE])
+    bases = _normalize_currencies(chunk[BASE_CURRENCY])
+    targets = _normalize_currencies(chunk[TARGET_CURRENCY])
+
+    valid = np.isfinite(rates) & (rates > 0) & ~np.isnat(dates)
+    for codes in (bases, targets):
+        valid &= (np.char.str_len(codes) == CURRENCY_CODE_LENGTH) & np.char.isalpha(codes)
+
+    date_strings = np.datetime_as_string(dates[valid], unit='D')
+    rows = list(
+        zip(bases[valid].tolist(), targets[valid].tolist(), rates[valid].tolist(), date_strings.tolist(), strict=True)
+    )
+    return rows, int(len(valid) - valid.sum())
+
+
+def _valid_rows(
+    path: Path, file_format: str, options: ImportOptions, stats: ImportStats
+) -> Iterator[list[tuple[str, str, float, str]]]:
+    columns: dict[str, str] | None = None
+    for chunk in read_chunks(path, file_format, options.chunk_size):
+        columns = columns or resolve_columns(list(chunk), options)
+        rows, invalid = validate_chunk(_to_long(chunk, columns, options))
+
+        stats.rows_read += len(rows) + invalid
+        stats.rows_invalid += invalid
+        if invalid and options.strict:
+            raise ValueError(f'{invalid} invalid row(s) in the chunk ending at row {stats.rows_read}')
+        if rows:
+            chunk_from = min(row[3] for row in rows)
+            chunk_to = max(row[3] for row in rows)
+            stats.date_from = min(stats.date_from or chunk_from, chunk_from)
+            stats.date_to = max(stats.date_to or chunk_to, chunk_to)
+
+        yield rows
+        logger.info(f'Imported {stats.rows_read} row(s) so far ({stats.rows_invalid} invalid)')
+
+
+def _pin_following_days(
+    cursor: sqlite3.Cursor, rows: list[tuple[str, str, float, str]], last_days: dict[str, str]
+) -> None:
+    """Pin the first loaded day after the rows of each base before they are inserted (change-only storage).
+
+    `last_days` holds the last imported day of each base so far, a day is only pinned when a batch goes past
+    it: the earlier pins keep the later days from seeing the rows imported before.
+    """
+    batch_last_days: dict[str, str] = {}
+    for base, _, _, day in rows:
+        batch_last_days[base] = max(batch_last_days.get(base, day), day)
+
+    for base, day in batch_last_days.items():
+        if day > last_days.get(base, ''):
+            last_days[base] = day
+            delta.pin_next_day(cursor, base, day)
+
+
+def _bulk_load(
+    conn: sqlite3.Connection,
+    insert_sql: str,
+    batches: Iterator[list[tuple[str, str, float, str]]],
+    stats: ImportStats,
+) -> None:
+    for pragma in BULK_PRAGMAS:
+        conn.execute(pragma)
+
+    try:
+        conn.execute('BEGIN')
+        cursor = conn.cursor()
+        changes_only = delta.get_storage_mode(cursor) == delta.STORAGE_CHANGES
+        for index_name in EXCHANGE_RATES_INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+        last_days: dict[str, str] = {}
+        for rows in batches:
+            if changes_only:
+                _pin_following_days(cursor, rows, last_days)
+            changes_before = conn.total_changes
+            conn.executemany(insert_sql, rows)
+            stats.rows_loaded += conn.total_changes - changes_before
+
+        logger.info('Recreating indexes and rebuilding rollups')
+        for index_sql in EXCHANGE_RATES_INDEXES.values():
+            conn.execute(index_sql)
+        if stats.date_from and stats.date_to:
+            if changes_only:
+                deleted = delta.compact_rows(cursor, get_settings().change_epsilon, stats.date_from, stats.date_to)
+                for base, day in last_days.items():
+                    if next_day := delta.next_loaded_day(cursor, base, day):
+                        deleted += delta.drop_unchanged(cursor, base, next_day)
+                logger.info(f'Dropped {deleted} unchanged rate(s) for change-only storage')
+            rollups.rebuild_rollup_tables(cursor, stats.date_from, stats.date_to)
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def run_import(path: Path, options: ImportOptions, db_path_str: str | None = None) -> ImportStats:
+    """Stream a CSV or Parquet dump into `exchange_rates` in a single transaction.
+
+    Secondary indexes are dropped for the load and recreated afterwards, and the rollup tables are rebuilt
+    once at the end instead of being maintained row by row. With change-only storage the imported range is
+    compacted before the rollups are rebuilt, and the first day loaded after the imported range is pinned
+    first, so the rates of the days after the range don't change.
+    """
+    file_format = options.file_format or path.suffix.lstrip('.').lower()
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown file format {file_format!r}, expected one of {", ".join(FORMATS)}')
+    if options.layout not in LAYOUTS:
+        raise ValueError(f'Unknown layout {options.layout!r}, expected one of {", ".join(LAYOUTS)}')
+
+    db_path = db_path_str or get_settings().db_path
+    verb = 'INSERT OR REPLACE' if options.force_overwrite else 'INSERT OR IGNORE'
+    insert_sql = f'{verb} INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)'
+
+    stats = ImportStats()
+    started = time.monotonic()
+
+    if options.dry_run:
+        for rows in _valid_rows(path, file_format, options, stats):
+            stats.rows_loaded += len(rows)
+    else:
+        init_database(db_path)
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        try:
+            _bulk_load(conn, insert_sql, _valid_rows(path, file_format, options, stats), stats)
+        finally:
+            conn.close()
+
+    elapsed = time.monotonic() - started
+    logger.info(f'Import of {path} finished in {elapsed:.1f}s ({stats.rows_read / max(elapsed, 1e-9):,.0f} rows/s)')
+    return stats
+
+
+def _parse_column_map(mappings: list[str]) -> dict[str, str]:
+    column_map = {}
+    for mapping in mappings:
+        record_field, sep, source = mapping.partition('=')
+        if not sep or record_field not in COLUMN_ALIASES:
+            raise ValueError(
+                f'Invalid --column {mapping!r}, expected FIELD=COLUMN with FIELD in {list(COLUMN_ALIASES)}'
+            )
+        column_map[record_field] = source
+    return column_map
+
+
+@app.command()
+def main(  # noqa: PLR0913
+    path: Annotated[Path, typer.Argument(exists=True, dir_okay=False, help='CSV or Parquet file to import.')],
+    file_format: Annotated[
+        Optional[str],  # noqa: UP007
+        typer.Option('--format', help='"csv" or "parquet" (default: from the file extension).'),
+    ] = None,
+    layout: Annotated[
+        str, typer.Option('--layout', help='"long" (date, currency, rate rows) or "wide" (a column per currency).')
+    ] = LAYOUT_LONG,
+    base: Annotated[
+        str, typer.Option('--base', help='Base currency for dumps without a base column.')
+    ] = DEFAULT_BASE_CURRENCY,
+    column: Annotated[
+        Optional[list[str]],  # noqa: UP007
+        typer.Option('--column', help='Map a field to a column, e.g. --column rate=Close. Can be repeated.'),
+    ] = None,
+    chunk_size: Annotated[int, typer.Option('--chunk-size', help='Rows per streamed chunk.')] = 200_000,
+    strict: Annotated[
+        bool, typer.Option('--strict', help='Fail on the first invalid row instead of skipping.')
+    ] = False,
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+    dry_run: Annotated[
+        bool, typer.Option('--dry-run', help='Read and validate the dump without modifying the database.')
+    ] = False,
+    force_overwrite: Annotated[
+        bool, typer.Option('--force-overwrite', help='Replace rates that are already in the database.')
+    ] = False,
+) -> None:
+    """Import a large CSV or Parquet dump of historical rates into the database."""
+    try:
+        options = ImportOptions(
+            file_format=file_format,
+            layout=layout,
+            base_currency=base.upper(),
+            column_map=_parse_column_map(column or []),
+            chunk_size=chunk_size,
+            strict=strict,
+            dry_run=dry_run,
+            force_overwrite=force_overwrite,
+        )
+        stats = run_import(path, options, db_path_str=db_path)
+    except ValueError as e:
+        logger.error(f'Import failed: {e}')
+        raise typer.Exit(code=1) from e
+
+    prefix = '[DRY RUN] Would import' if dry_run else 'Imported'
+    logger.info(f'{prefix} {stats.rows_loaded} of {stats.rows_read} row(s), {stats.rows_invalid} invalid')
+
+
+if __name__ == '__main__':
+    app()
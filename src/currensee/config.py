@@ -1,16 +1,31 @@
 from pathlib import Path
 
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from currensee.constants import DEFAULT_BASE_CURRENCY
+
 
 class Settings(BaseSettings):
     # OpenExchangeRates API Configuration
     oe_api_key: str
     oe_api_base_url: str = 'https://openexchangerates.org/api'
 
+    # Secondary provider, requests are hedged with it when the primary is slow or failing (e.g. 'frankfurter')
+    secondary_provider: str | None = None
+    frankfurter_api_base_url: str = 'https://api.frankfurter.dev/v1'
+    hedge_after_seconds: float = 2.0
+    provider_timeout_seconds: float = 30.0
+
     storage_base_path: str = str(Path(__file__).parent.parent.parent.parent / 'data')
     stage_dir: str = 'stage/exchange-rates/daily'
+    hourly_stage_dir: str = 'stage/exchange-rates/hourly'
+    storage_fsync: str = 'none'
     db_path: str = 'data/exchange_rates.db'
+    # 'changes' only stores daily rates that moved by more than change_epsilon (relative), see currensee.delta
+    storage_mode: str = 'full'
+    change_epsilon: float = 0.0
+    base_currencies: list[str] = Field(default_factory=lambda: [DEFAULT_BASE_CURRENCY])
 
     model_config = SettingsConfigDict(
         env_file='.env',
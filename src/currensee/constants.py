@@ -9,3 +9,11 @@ API_BASE = 'base'
 API_RATES = 'rates'
 API_DATE = 'date'  # Note: OER API uses 'timestamp', but I added 'date' during processing if needed
 API_TIMESTAMP = 'timestamp'
+
+# Extraction/loading granularity
+DEFAULT_BASE_CURRENCY = 'USD'
+GRANULARITY_DAILY = 'daily'
+GRANULARITY_HOURLY = 'hourly'
+GRANULARITIES = (GRANULARITY_DAILY, GRANULARITY_HOURLY)
+DAILY_KEY_FORMAT = '%Y-%m-%d'
+HOURLY_KEY_FORMAT = '%Y-%m-%dT%H'
@@ -0,0 +1,321 @@
+"""Change-only storage of daily rates, reconstructed with as-of semantics.
+
+In the `changes` storage mode a daily rate is only stored when it moved by more than `CHANGE_EPSILON` (relative)
+since the last stored rate of that currency, and the days that were loaded are recorded in `loaded_days`. The
+rate of a currency on a loaded day is the last stored rate on or before that day. The `exchange_rates_asof`
+view applies this to every loaded day, so SQL consumers see full daily rows whatever the mode, and
+`currensee.query` and the rollups do the same reconstruction.
+
+The mode is a property of the database (stored in `storage_meta`), a `full` database can be converted with
+`python -m currensee.delta compact`.
+"""
+import logging
+import sqlite3
+from collections.abc import Iterable
+from typing import Annotated
+
+import typer
+
+from currensee.config import get_settings
+from currensee.logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger('currensee.delta')
+app = typer.Typer()
+
+STORAGE_FULL = 'full'
+STORAGE_CHANGES = 'changes'
+STORAGE_MODES = (STORAGE_FULL, STORAGE_CHANGES)
+
+LOADED_DAYS_TABLE = 'loaded_days'
+ASOF_VIEW = 'exchange_rates_asof'
+
+# A rate as stored in exchange_rates: (base_currency, target_currency, rate, date)
+RateRow = tuple[str, str, float, str]
+
+# Last stored rate of every currency of a base on or before (`<=`) / strictly before (`<`) a date. The
+# currencies are enumerated by skipping through the (base_currency, target_currency, date) unique index, and
+# each rate is one more seek on it, instead of scanning all rows of the base.
+AS_OF_SQL = """
+WITH RECURSIVE currencies (target_currency) AS (
+    SELECT MIN(target_currency) FROM exchange_rates WHERE base_currency = :base
+    UNION ALL
+    SELECT (
+        SELECT MIN(target_currency) FROM exchange_rates
+        WHERE base_currency = :base AND target_currency > currencies.target_currency
+    )
+    FROM currencies WHERE target_currency IS NOT NULL
+)
+SELECT currencies.target_currency, (
+    SELECT rate FROM exchange_rates
+    WHERE base_currency = :base AND target_currency = currencies.target_currency AND date {op} :day
+    ORDER BY date DESC LIMIT 1
+)
+FROM currencies WHERE target_currency IS NOT NULL
+"""
+
+# Reconstructed daily rates of one currency in a date range, one seek per loaded day
+CURRENCY_DAILY_RATES_SQL = f"""
+SELECT * FROM (
+    SELECT
+        (
+            SELECT rate FROM exchange_rates
+            WHERE base_currency = :base AND target_currency = :target AND date <= days.date
+            ORDER BY date DESC LIMIT 1
+        ) AS rate,
+        days.date
+    FROM {LOADED_DAYS_TABLE} AS days
+    WHERE days.base_currency = :base AND days.date BETWEEN :date_from AND :date_to
+)
+WHERE rate IS NOT NULL
+"""
+
+
+def init_delta_tables(cursor: sqlite3.Cursor, storage_mode: str) -> None:
+    """Create the change-only storage tables and check the configured mode against the database's."""
+    if storage_mode not in STORAGE_MODES:
+        raise ValueError(f'Unknown storage mode {storage_mode!r}, expected one of {", ".join(STORAGE_MODES)}')
+
+    cursor.execute('CREATE TABLE IF NOT EXISTS storage_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    cursor.execute(
+        f"""
+    CREATE TABLE IF NOT EXISTS {LOADED_DAYS_TABLE} (
+        base_currency TEXT NOT NULL,
+        date TEXT NOT NULL,
+        PRIMARY KEY (base_currency, date)
+    ) WITHOUT ROWID
+    """
+    )
+    # Every stored rate is valid until the next change of its currency, which covers the loaded days in between
+    cursor.execute(
+        f"""
+    CREATE VIEW IF NOT EXISTS {ASOF_VIEW} AS
+    SELECT changes.base_currency, changes.target_currency, changes.rate, days.date
+    FROM (
+        SELECT
+            base_currency,
+            target_currency,
+            rate,
+            date AS valid_from,
+            LEAD(date, 1, '9999-12-31') OVER (PARTITION BY base_currency, target_currency ORDER BY date) AS valid_to
+        FROM exchange_rates
+    ) AS changes
+    JOIN {LOADED_DAYS_TABLE} AS days
+        ON days.base_currency = changes.base_currency
+        AND days.date >= changes.valid_from
+        AND days.date < changes.valid_to
+    """
+    )
+
+    stored_mode = get_storage_mode(cursor, default=None)
+    if stored_mode is None:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM exchange_rates)')
+        if cursor.fetchone()[0] and storage_mode == STORAGE_CHANGES:
+            raise ValueError(
+                'The database already holds full daily rates, convert it with `python -m currensee.delta compact`'
+            )
+        _set_storage_mode(cursor, storage_mode)
+    elif stored_mode != storage_mode:
+        raise ValueError(f'The database uses the {stored_mode!r} storage mode but {storage_mode!r} is configured')
+
+
+def get_storage_mode(cursor: sqlite3.Cursor, default: str | None = STORAGE_FULL) -> str | None:
+    """Storage mode of the database, databases created before change-only storage existed are `full`."""
+    try:
+        cursor.execute("SELECT value FROM storage_meta WHERE key = 'storage_mode'")
+    except sqlite3.OperationalError:
+        return default
+    row = cursor.fetchone()
+    return str(row[0]) if row else default
+
+
+def _set_storage_mode(cursor: sqlite3.Cursor, storage_mode: str) -> None:
+    cursor.execute(
+        "INSERT INTO storage_meta (key, value) VALUES ('storage_mode', ?) "
+        'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+        (storage_mode,),
+    )
+
+
+def as_of(cursor: sqlite3.Cursor, base_currency: str, day: str, inclusive: bool = True) -> dict[str, float]:
+    """Rates of every currency on `day` (or strictly before it) as reconstructed from the stored changes."""
+    cursor.execute(AS_OF_SQL.format(op='<=' if inclusive else '<'), {'base': base_currency, 'day': day})
+    return {target: rate for target, rate in cursor.fetchall() if rate is not None}
+
+
+def is_loaded(cursor: sqlite3.Cursor, base_currency: str, day: str) -> bool:
+    cursor.execute(f'SELECT 1 FROM {LOADED_DAYS_TABLE} WHERE base_currency = ? AND date = ?', (base_currency, day))
+    return cursor.fetchone() is not None
+
+
+def is_change(rate: float, previous: float | None, epsilon: float) -> bool:
+    return previous is None or abs(rate - previous) > epsilon * abs(previous)
+
+
+def insert_changes(cursor: sqlite3.Cursor, rows: list[RateRow], day: str, epsilon: float) -> int:
+    """Store one day of rates (all of one base currency), keeping only the ones that changed.
+
+    Any rows already stored for the day are replaced. When the day is loaded before an already loaded later
+    day, the later day's rates are pinned with extra rows so they don't change, and its rows that no longer
+    are a change are dropped. Returns the number of rows written.
+    """
+    base = rows[0][0]
+    previous = as_of(cursor, base, day, inclusive=False)
+    next_day, pinned = pin_next_day(cursor, base, day)
+
+    cursor.execute('DELETE FROM exchange_rates WHERE base_currency = ? AND date = ?', (base, day))
+    changed = [row for row in rows if is_change(row[2], previous.get(row[1]), epsilon)]
+    _insert_rows(cursor, changed)
+    cursor.execute(f'INSERT OR IGNORE INTO {LOADED_DAYS_TABLE} (base_currency, date) VALUES (?, ?)', (base, day))
+
+    if next_day:
+        pinned -= drop_unchanged(cursor, base, next_day)
+    return len(changed) + pinned
+
+
+def next_loaded_day(cursor: sqlite3.Cursor, base_currency: str, day: str) -> str | None:
+    cursor.execute(
+        f'SELECT MIN(date) FROM {LOADED_DAYS_TABLE} WHERE base_currency = ? AND date > ?', (base_currency, day)
+    )
+    next_day: str | None = cursor.fetchone()[0]
+    return next_day
+
+
+def pin_next_day(cursor: sqlite3.Cursor, base_currency: str, day: str) -> tuple[str | None, int]:
+    """Store every rate of the first loaded day after `day` as an explicit row.
+
+    Rates written on or before `day` afterwards can't change that day (nor the days after it) anymore.
+    Returns the pinned day, None if no later day is loaded, and the number of rows added.
+    """
+    next_day = next_loaded_day(cursor, base_currency, day)
+    if next_day is None:
+        return None, 0
+
+    changes_before = cursor.connection.total_changes
+    cursor.executemany(
+        'INSERT OR IGNORE INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)',
+        [(base_currency, target, rate, next_day) for target, rate in as_of(cursor, base_currency, next_day).items()],
+    )
+    return next_day, cursor.connection.total_changes - changes_before
+
+
+def drop_unchanged(cursor: sqlite3.Cursor, base_currency: str, day: str) -> int:
+    """Delete the rows of `day` repeating exactly the rate before it (pins that became useless), returns the count."""
+    previous = as_of(cursor, base_currency, day, inclusive=False)
+    cursor.execute(
+        'SELECT target_currency, rate FROM exchange_rates WHERE base_currency = ? AND date = ?', (base_currency, day)
+    )
+    unchanged = [(base_currency, target, day) for target, rate in cursor.fetchall() if previous.get(target) == rate]
+    cursor.executemany(
+        'DELETE FROM exchange_rates WHERE base_currency = ? AND target_currency = ? AND date = ?', unchanged
+    )
+    return len(unchanged)
+
+
+def _insert_rows(cursor: sqlite3.Cursor, rows: Iterable[RateRow]) -> None:
+    cursor.executemany(
+        'INSERT INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)', rows
+    )
+
+
+def compact_rows(
+    cursor: sqlite3.Cursor, epsilon: float, date_from: str | None = None, date_to: str | None = None
+) -> int:
+    """Record the stored days as loaded and delete the rows that didn't change, returns the rows deleted.
+
+    Every row is compared to the last row kept before it (not simply the previous row), so with a non-zero
+    epsilon slow drifts are still stored once they add up. With `date_from`/`date_to` only rows in that range
+    are considered for deletion.
+    """
+    date_from = date_from or '0000-00-00'
+    date_to = date_to or '9999-99-99'
+    cursor.execute(
+        f"""
+    INSERT OR IGNORE INTO {LOADED_DAYS_TABLE} (base_currency, date)
+    SELECT DISTINCT base_currency, date FROM exchange_rates WHERE date BETWEEN ? AND ?
+    """,
+        (date_from, date_to),
+    )
+
+    cursor.execute(
+        """
+    SELECT id, base_currency, target_currency, rate, date FROM exchange_rates
+    WHERE date <= ?
+    ORDER BY base_currency, target_currency, date
+    """,
+        (date_to,),
+    )
+    redundant: list[int] = []
+    currency: tuple[str, str] | None = None
+    kept: float | None = None
+    for row_id, base, target, rate, day in cursor.fetchall():
+        if (base, target) != currency:
+            currency, kept = (base, target), None
+        if day >= date_from and not is_change(rate, kept, epsilon):
+            redundant.append(row_id)
+        else:
+            kept = rate
+
+    # Deleting in rowid order keeps the table b-tree access sequential
+    cursor.executemany('DELETE FROM exchange_rates WHERE id = ?', ((row_id,) for row_id in sorted(redundant)))
+    return len(redundant)
+
+
+def compact(db_path: str, epsilon: float | None = None) -> int:
+    """Convert a database to the change-only storage mode and reclaim the freed space."""
+    epsilon = get_settings().change_epsilon if epsilon is None else epsilon
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            cursor = conn.cursor()
+            init_delta_tables(cursor, get_storage_mode(cursor) or STORAGE_FULL)
+            deleted = compact_rows(cursor, epsilon)
+            _set_storage_mode(cursor, STORAGE_CHANGES)
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    return deleted
+
+
+@app.command(name='compact')
+def compact_command(
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+    epsilon: Annotated[
+        float, typer.Option('--epsilon', help='Relative change below which a rate is not stored (default: config).')
+    ] = get_settings().change_epsilon,
+) -> None:
+    """Convert the database to change-only storage, dropping rates that didn't change since the previous day.
+
+    Set STORAGE_MODE=changes afterwards so the loaders keep writing changes only.
+    """
+    deleted = compact(db_path, epsilon)
+    logger.info(f'Deleted {deleted} unchanged rate(s), {db_path} now uses change-only storage')
+
+
+@app.command()
+def stats(
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+) -> None:
+    """Print the storage mode and how many daily rates are stored compared to the ones they represent."""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        storage_mode = get_storage_mode(cursor)
+        stored = cursor.execute('SELECT COUNT(*) FROM exchange_rates').fetchone()[0]
+        represented = stored
+        if storage_mode == STORAGE_CHANGES:
+            represented = cursor.execute(f'SELECT COUNT(*) FROM {ASOF_VIEW}').fetchone()[0]
+    finally:
+        conn.close()
+
+    typer.echo(f'storage mode:\t{storage_mode}')
+    typer.echo(f'stored rates:\t{stored}')
+    typer.echo(f'daily rates:\t{represented}')
+
+
+if __name__ == '__main__':
+    app()
@@ -1,17 +1,25 @@
-"""Extraction module for fetching exchange rate data from OpenExchangeRates API."""
+"""Extraction module for fetching exchange rate data from OpenExchangeRates API (and optional fallbacks)."""
 import json
 import logging
-from datetime import date, datetime, timedelta
-from typing import Annotated, Any, Optional, cast
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated, Optional
 
-import requests
 import typer
-from pydantic import ValidationError
-from requests.exceptions import RequestException
 
 from currensee.config import get_settings
+from currensee.constants import (
+    DAILY_KEY_FORMAT,
+    DEFAULT_BASE_CURRENCY,
+    GRANULARITIES,
+    GRANULARITY_DAILY,
+    GRANULARITY_HOURLY,
+    HOURLY_KEY_FORMAT,
+)
 from currensee.logging_config import setup_logging
-from currensee.models import OpenExchangeRatesResponse
+from currensee.providers import HedgedProvider, RateProvider, build_provider, is_fallback
 from currensee.storage import LocalStorageWriter, StorageWriter
 
 setup_logging()
@@ -19,113 +27,144 @@ logger = logging.getLogger('currensee.extract')
 app = typer.Typer()
 
 
-class OpenExchangeRatesClient:
-    """OpenExchangeRates API client for fetching latest and historical rates.
+def date_range(start_date: date, end_date: date) -> list[date]:
+    if start_date > end_date:
+        raise ValueError('Start date cannot be after end date')
+    delta = (end_date - start_date).days + 1
+    return [start_date + timedelta(days=i) for i in range(delta)]
 
-    API documentation:
-    - Latest rates: https://openexchangerates.org/api/latest
-    - Historical rates: https://openexchangerates.org/api/historical/
-    """
 
-    def __init__(self, api_key: str | None = None, base_url: str | None = None) -> None:
-        settings = get_settings()
-        self.api_key = api_key or settings.oe_api_key
-        self.base_url = base_url or settings.oe_api_base_url
+@dataclass
+class RateSelection:
+    """Which rates a job handles: base currencies (default: from config) and the granularity."""
 
-    def get_exchange_rates(self, date_str: str, base: str = 'USD') -> OpenExchangeRatesResponse:
-        today = date.today().strftime('%Y-%m-%d')
+    base_currencies: list[str] | None = None
+    granularity: str = GRANULARITY_DAILY
 
-        if date_str == today:
-            endpoint = f'{self.base_url}/latest.json'
-            logger.info("Using latest endpoint for today's rates")
-        else:
-            endpoint = f'{self.base_url}/historical/{date_str}.json'
-            logger.info(f'Using historical endpoint for {date_str}')
 
-        params = {'app_id': self.api_key, 'base': base}
+def period_keys(dates: list[date], granularity: str = GRANULARITY_DAILY) -> list[str]:
+    """Storage keys for the given dates: `YYYY-MM-DD` for daily, `YYYY-MM-DDTHH` (UTC hours) for hourly data."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity!r}, expected one of {", ".join(GRANULARITIES)}')
+    if granularity == GRANULARITY_DAILY:
+        return [d.strftime(DAILY_KEY_FORMAT) for d in dates]
+    return [f'{d.strftime(DAILY_KEY_FORMAT)}T{hour:02d}' for d in dates for hour in range(24)]
 
-        try:
-            response = requests.get(endpoint, params=params)
-            response.raise_for_status()
-            raw_data = cast(dict[str, Any], response.json())
 
-            validated_data: OpenExchangeRatesResponse = OpenExchangeRatesResponse.model_validate(raw_data)
-            validated_data.date_str = date_str
-            return validated_data
+def _fetch_key(
+    client: RateProvider,
+    storage_writer: StorageWriter,
+    key: str,
+    base: str,
+    granularity: str,
+) -> str:
+    if granularity == GRANULARITY_HOURLY:
+        data_model = client.get_latest_rates(base)
+    else:
+        data_model = client.get_exchange_rates(key, base)
+    data_dict = data_model.model_dump(by_alias=True)
+    return storage_writer.write(data=data_dict, date_str=key, force_overwrite=True)
 
-        except RequestException as e:
-            logger.error(f'API request failed for {date_str}: {e}')
-            raise ValueError(f'API request failed: {e}') from e
-        except ValidationError as e:
-            logger.error(f'API response validation failed for {date_str}: {e}')
-            raise ValueError(f'Invalid API response format: {e}') from e
-        except json.JSONDecodeError as e:
-            logger.error(f'Failed to decode API response JSON for {date_str}: {e}')
-            raise ValueError(f'Invalid JSON received from API: {e}') from e
 
+def _staged_by_fallback(storage_writer: StorageWriter, key: str) -> str | None:
+    """The secondary provider a staged file came from, None if it came from the primary one.
 
-def date_range(start_date: date, end_date: date) -> list[date]:
-    if start_date > end_date:
-        raise ValueError('Start date cannot be after end date')
-    delta = (end_date - start_date).days + 1
-    return [start_date + timedelta(days=i) for i in range(delta)]
+    Secondary providers cover fewer currencies, so their files only stand in until the primary answers again.
+    """
+    with open(storage_writer.get_path(key)) as f:
+        provider = json.load(f).get('provider')
+    return str(provider) if is_fallback(provider) else None
+
+
+@contextmanager
+def _provider_session(provider: RateProvider | None) -> Iterator[RateProvider]:
+    """Use the given provider or build the configured one, reporting hedging stats when done."""
+    client = provider or build_provider()
+    try:
+        yield client
+    finally:
+        if isinstance(client, HedgedProvider):
+            client.log_stats()
+            if provider is None:
+                client.close()
 
 
-def run_extraction(
+def run_extraction(  # noqa: PLR0913
     date_from: date,
     date_to: date,
     dry_run: bool = False,
     force_overwrite: bool = False,
     storage_writer: StorageWriter | None = None,
-) -> dict[str, str]:
-    if storage_writer is None:
-        storage_writer = LocalStorageWriter()
-
-    client = OpenExchangeRatesClient()
-    dates_to_process = date_range(date_from, date_to)
-    result: dict[str, str] = {}
-
-    for current_date in dates_to_process:
-        date_str = current_date.strftime('%Y-%m-%d')
-
-        try:
-            if storage_writer.exists(date_str) and not force_overwrite:
-                logger.info(f'Data for {date_str} already exists, skipping...')
-                result[date_str] = storage_writer.get_path(date_str)
-                continue
-
-            if dry_run:
-                logger.info(f'[DRY RUN] Would fetch exchange rates for {date_str}')
-                result[date_str] = storage_writer.get_path(date_str)
-                continue
-            else:
-                logger.info(f'Fetching exchange rates for {date_str}')
-                data_model = client.get_exchange_rates(date_str)
-                data_dict = data_model.model_dump(by_alias=True)
-            path = storage_writer.write(
-                data=data_dict,
-                date_str=date_str,
-                force_overwrite=force_overwrite,
-                dry_run=dry_run,
-            )
-
-            result[date_str] = path
-            logger.info(f'Successfully saved exchange rates for {date_str} to {path}')
-
-        except ValueError as e:
-            logger.error(f'Failed to process {date_str}: {e}')
-            if not dry_run:
-                raise
-        except Exception as e:
-            logger.exception(f'Unexpected extraction job failure: {e}')
-            if not dry_run:
-                raise
+    selection: RateSelection | None = None,
+    provider: RateProvider | None = None,
+) -> dict[tuple[str, str], str]:
+    """Fetch and stage rates for every (base currency, period key) pair.
+
+    Hourly extraction can only take the current snapshot from the `latest` endpoint, so the date range is
+    ignored and the current UTC hour is used as the key. A custom `storage_writer` can only be used with a
+    single base currency. Without a `provider` the configured one is used (see `providers.build_provider`).
+    Periods staged from a secondary provider are fetched again even if they exist.
+    """
+    selection = selection or RateSelection()
+    base_currencies = selection.base_currencies or get_settings().base_currencies
+    if storage_writer is not None and len(base_currencies) > 1:
+        raise ValueError('A custom storage writer can only be used with a single base currency')
+
+    if selection.granularity == GRANULARITY_HOURLY:
+        keys = [datetime.now(tz=timezone.utc).strftime(HOURLY_KEY_FORMAT)]
+    else:
+        keys = period_keys(date_range(date_from, date_to), selection.granularity)
+
+    result: dict[tuple[str, str], str] = {}
+
+    with _provider_session(provider) as client:
+        for base in base_currencies:
+            writer = storage_writer or LocalStorageWriter.for_granularity(selection.granularity, base)
+
+            try:
+                for key in keys:
+                    label = key if base == DEFAULT_BASE_CURRENCY else f'{key} ({base})'
+
+                    try:
+                        with writer.lock(key) as acquired:
+                            if not acquired:
+                                logger.info(f'Data for {label} is being fetched by another process, skipping...')
+                                continue
+
+                            if writer.exists(key) and not force_overwrite:
+                                fallback = _staged_by_fallback(writer, key)
+                                if fallback is None:
+                                    logger.info(f'Data for {label} already exists, skipping...')
+                                    result[(base, key)] = writer.get_path(key)
+                                    continue
+                                logger.info(f'Data for {label} was staged from {fallback}, fetching it again')
+
+                            if dry_run:
+                                logger.info(f'[DRY RUN] Would fetch exchange rates for {label}')
+                                result[(base, key)] = writer.get_path(key)
+                                continue
+
+                            logger.info(f'Fetching exchange rates for {label}')
+                            path = _fetch_key(client, writer, key, base, selection.granularity)
+                            result[(base, key)] = path
+                            logger.info(f'Successfully saved exchange rates for {label} to {path}')
+
+                    except ValueError as e:
+                        logger.error(f'Failed to process {label}: {e}')
+                        if not dry_run:
+                            raise
+                    except Exception as e:
+                        logger.exception(f'Unexpected extraction job failure: {e}')
+                        if not dry_run:
+                            raise
+            finally:
+                writer.flush()
 
     return result
 
 
 @app.command()
-def main(
+def main(  # noqa: PLR0913
     date_from: Annotated[
         Optional[datetime],  # noqa: UP007
         typer.Option(formats=['%Y-%m-%d'], help='Start date in YYYY-MM-DD format. Required if --date-to is set.'),
@@ -138,12 +177,28 @@ def main(
         bool, typer.Option('--dry-run', help='Simulate the extraction without actually fetching or writing data.')
     ] = False,
     force_overwrite: Annotated[bool, typer.Option('--force-overwrite', help='Overwrite existing data files.')] = False,
+    base: Annotated[
+        Optional[list[str]],  # noqa: UP007
+        typer.Option('--base', help='Base currency to fetch, can be repeated (default: from config).'),
+    ] = None,
+    granularity: Annotated[
+        str, typer.Option('--granularity', help='Either "daily" or "hourly" (current snapshot only).')
+    ] = GRANULARITY_DAILY,
 ) -> None:
-    """Extract exchange rates from OpenExchangeRates API for a given date range.
+    """Extract exchange rates from OpenExchangeRates API (hedged with SECONDARY_PROVIDER if set) for a date range.
 
     If no dates are provided, defaults to today's date for both start and end.
     If either --date-from or --date-to is provided, both must be specified.
+    Hourly extraction always takes the current snapshot and doesn't accept dates.
     """
+    if granularity not in GRANULARITIES:
+        logger.error(f'Unknown granularity {granularity!r}, expected one of {", ".join(GRANULARITIES)}.')
+        raise typer.Exit(code=1)
+
+    if granularity == GRANULARITY_HOURLY and (date_from is not None or date_to is not None):
+        logger.error('Hourly extraction only supports the current snapshot, --date-from/--date-to are not allowed.')
+        raise typer.Exit(code=1)
+
     if date_from is None and date_to is None:
         today_date = date.today()
         date_from_date = today_date
@@ -166,12 +221,16 @@ def main(
             date_to=date_to_date,
             dry_run=dry_run,
             force_overwrite=force_overwrite,
+            selection=RateSelection(
+                base_currencies=[b.upper() for b in base] if base else None,
+                granularity=granularity,
+            ),
         )
 
         if dry_run:
-            logger.info(f'[DRY RUN] Would process {len(result)} date(s)')
+            logger.info(f'[DRY RUN] Would process {len(result)} period(s)')
         else:
-            logger.info(f'Successfully processed {len(result)} date(s)')
+            logger.info(f'Successfully processed {len(result)} period(s)')
 
     except ValueError as e:
         logger.error(f'Extraction job failed: {e}')
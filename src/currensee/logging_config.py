@@ -22,6 +22,11 @@ LOGGING_CONFIG = {
             'level': 'INFO',
             'propagate': False,
         },
+        'currensee.delta': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'currensee.extract': {
             'handlers': ['console'],
             'level': 'INFO',
@@ -32,6 +37,36 @@ LOGGING_CONFIG = {
             'level': 'INFO',
             'propagate': False,
         },
+        'currensee.bulk_import': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'currensee.providers': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'currensee.quality': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'currensee.query': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'currensee.rollups': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'currensee.storage': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'currensee.demo': {
             'handlers': ['console'],
             'level': 'INFO',
@@ -19,6 +19,7 @@ class ExchangeRateRecord(BaseModel):
     target_currency: str = Field(..., alias=TARGET_CURRENCY)
     rate: float = Field(..., alias=RATE)
     record_date: date = Field(..., alias=DATE)
+    rate_timestamp: int | None = Field(None, alias=API_TIMESTAMP)
 
     model_config: ClassVar[ConfigDict] = ConfigDict(populate_by_name=True)
 
@@ -30,6 +31,7 @@ class OpenExchangeRatesResponse(BaseModel):
     base: str = Field(..., alias=API_BASE)
     rates: dict[str, float] = Field(..., alias=API_RATES)
     date_str: str | None = Field(None, alias=DATE)
+    provider: str | None = None
 
     @field_validator('rates')
     def check_rates_not_empty(cls, v: dict[str, float]) -> dict[str, float]:  # noqa: N805
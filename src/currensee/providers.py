@@ -0,0 +1,324 @@
+"""Exchange rate providers and hedged requests across them.
+
+Every provider returns an `OpenExchangeRatesResponse`, so the rest of the pipeline doesn't care where the
+rates came from (the `provider` field records it in the staged file).
+"""
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Protocol, cast
+
+import requests
+from pydantic import ValidationError
+from requests.exceptions import RequestException
+
+from currensee.config import get_settings
+from currensee.constants import DAILY_KEY_FORMAT, DEFAULT_BASE_CURRENCY
+from currensee.models import OpenExchangeRatesResponse
+
+logger = logging.getLogger('currensee.providers')
+
+OPEN_EXCHANGE_RATES = 'openexchangerates'
+FRANKFURTER = 'frankfurter'
+
+
+def is_fallback(provider_name: str | None) -> bool:
+    """Whether rates came from a secondary provider, files staged before providers were recorded are primary."""
+    return provider_name not in (None, OPEN_EXCHANGE_RATES)
+
+
+class RateProvider(Protocol):
+    name: str
+
+    def get_exchange_rates(self, date_str: str, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        ...
+
+    def get_latest_rates(self, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        ...
+
+
+def _validate(raw_data: dict[str, Any], label: str) -> OpenExchangeRatesResponse:
+    try:
+        validated_data: OpenExchangeRatesResponse = OpenExchangeRatesResponse.model_validate(raw_data)
+        return validated_data
+    except ValidationError as e:
+        logger.error(f'API response validation failed for {label}: {e}')
+        raise ValueError(f'Invalid API response format: {e}') from e
+
+
+def _get_json(endpoint: str, params: dict[str, str], timeout: float, label: str) -> dict[str, Any]:
+    try:
+        response = requests.get(endpoint, params=params, timeout=timeout)
+        response.raise_for_status()
+        return cast(dict[str, Any], response.json())
+    except RequestException as e:
+        logger.error(f'API request failed for {label}: {e}')
+        raise ValueError(f'API request failed: {e}') from e
+    except json.JSONDecodeError as e:
+        logger.error(f'Failed to decode API response JSON for {label}: {e}')
+        raise ValueError(f'Invalid JSON received from API: {e}') from e
+
+
+class OpenExchangeRatesClient:
+    """OpenExchangeRates API client for fetching latest and historical rates.
+
+    API documentation:
+    - Latest rates: https://openexchangerates.org/api/latest
+    - Historical rates: https://openexchangerates.org/api/historical/
+    """
+
+    name = OPEN_EXCHANGE_RATES
+
+    def __init__(self, api_key: str | None = None, base_url: str | None = None, timeout: float | None = None) -> None:
+        settings = get_settings()
+        self.api_key = api_key or settings.oe_api_key
+        self.base_url = base_url or settings.oe_api_base_url
+        self.timeout = timeout or settings.provider_timeout_seconds
+
+    def get_exchange_rates(self, date_str: str, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        today = date.today().strftime('%Y-%m-%d')
+
+        if date_str == today:
+            endpoint = f'{self.base_url}/latest.json'
+            logger.info("Using latest endpoint for today's rates")
+        else:
+            endpoint = f'{self.base_url}/historical/{date_str}.json'
+            logger.info(f'Using historical endpoint for {date_str}')
+
+        validated_data = self._fetch(endpoint, base, date_str)
+        validated_data.date_str = date_str
+        return validated_data
+
+    def get_latest_rates(self, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        """Fetch the current (hourly) snapshot, dated by the UTC day of its timestamp."""
+        validated_data = self._fetch(f'{self.base_url}/latest.json', base, 'latest')
+        validated_data.date_str = datetime.fromtimestamp(validated_data.timestamp, tz=timezone.utc).strftime(
+            DAILY_KEY_FORMAT
+        )
+        return validated_data
+
+    def _fetch(self, endpoint: str, base: str, label: str) -> OpenExchangeRatesResponse:
+        raw_data = _get_json(endpoint, {'app_id': self.api_key, 'base': base}, self.timeout, label)
+        validated_data = _validate(raw_data, label)
+        validated_data.provider = self.name
+        return validated_data
+
+
+class FrankfurterClient:
+    """Frankfurter API client (ECB reference rates, no API key needed), used as the secondary provider.
+
+    The ECB publishes ~30 currencies on working days only, for other days the last published rates are returned.
+    Files staged from it are fetched again from the primary provider on the next run (see `currensee.extract`).
+    API documentation: https://frankfurter.dev
+    """
+
+    name = FRANKFURTER
+
+    def __init__(self, base_url: str | None = None, timeout: float | None = None) -> None:
+        settings = get_settings()
+        self.base_url = base_url or settings.frankfurter_api_base_url
+        self.timeout = timeout or settings.provider_timeout_seconds
+
+    def get_exchange_rates(self, date_str: str, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        validated_data = self._fetch(f'{self.base_url}/{date_str}', base, date_str)
+        validated_data.date_str = date_str
+        return validated_data
+
+    def get_latest_rates(self, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        """Fetch the last published rates, stamped with the fetch time like an hourly snapshot of the primary."""
+        validated_data = self._fetch(f'{self.base_url}/latest', base, 'latest')
+        now = datetime.now(tz=timezone.utc)
+        validated_data.timestamp = int(now.timestamp())
+        validated_data.date_str = now.strftime(DAILY_KEY_FORMAT)
+        return validated_data
+
+    def _fetch(self, endpoint: str, base: str, label: str) -> OpenExchangeRatesResponse:
+        raw_data = _get_json(endpoint, {'base': base}, self.timeout, label)
+        if 'date' not in raw_data:
+            raise ValueError(f'Invalid API response format: missing date for {label}')
+
+        published = datetime.strptime(raw_data['date'], DAILY_KEY_FORMAT).replace(tzinfo=timezone.utc)
+        normalized = {
+            'timestamp': int(published.timestamp()),
+            'base': raw_data.get('base', base),
+            # The base isn't listed in Frankfurter rates, OpenExchangeRates lists it with 1.0
+            'rates': {**raw_data.get('rates', {}), base: 1.0},
+            'date': raw_data['date'],
+            'provider': self.name,
+        }
+        return _validate(normalized, label)
+
+
+class StubProvider:
+    """Local provider returning fixed rates, with an optional delay or failure. Meant for tests and dry runs."""
+
+    def __init__(
+        self,
+        name: str = 'stub',
+        rates: dict[str, float] | None = None,
+        delay: float = 0.0,
+        error: Exception | None = None,
+    ) -> None:
+        self.name = name
+        self.rates = rates or {DEFAULT_BASE_CURRENCY: 1.0}
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def get_exchange_rates(self, date_str: str, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        day = datetime.strptime(date_str, DAILY_KEY_FORMAT).replace(tzinfo=timezone.utc)
+        return self._respond(int(day.timestamp()), base, date_str)
+
+    def get_latest_rates(self, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        now = datetime.now(tz=timezone.utc)
+        return self._respond(int(now.timestamp()), base, now.strftime(DAILY_KEY_FORMAT))
+
+    def _respond(self, timestamp: int, base: str, date_str: str) -> OpenExchangeRatesResponse:
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return OpenExchangeRatesResponse(
+            timestamp=timestamp, base=base, rates=dict(self.rates), date_str=date_str, provider=self.name
+        )
+
+
+def _succeeded(futures: set[Future[OpenExchangeRatesResponse]]) -> bool:
+    return any(future.exception() is None for future in futures)
+
+
+@dataclass
+class ProviderStats:
+    requests: int = 0
+    errors: int = 0
+    wins: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        completed = self.requests - self.errors
+        return self.total_latency / completed if completed else 0.0
+
+
+class HedgedProvider:
+    """Ask the primary provider and, if it hasn't answered within `hedge_after` seconds, the secondary too.
+
+    Whichever successful response arrives first wins, a failing primary hands over to the secondary right
+    away. The losing request is cancelled if it hasn't started yet, otherwise left to finish in the background.
+    Each provider has its own thread pool, so a hedge never queues behind abandoned slow primary requests.
+    Per-provider latency and error counts are collected in `stats`.
+    """
+
+    def __init__(self, primary: RateProvider, secondary: RateProvider, hedge_after: float | None = None) -> None:
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_after = hedge_after if hedge_after is not None else get_settings().hedge_after_seconds
+        self.name = f'{primary.name}+{secondary.name}'
+        self.stats = {primary.name: ProviderStats(), secondary.name: ProviderStats()}
+        self._stats_lock = threading.Lock()
+        self._executors = {
+            provider.name: ThreadPoolExecutor(max_workers=4, thread_name_prefix=f'currensee-{provider.name}')
+            for provider in (primary, secondary)
+        }
+
+    def get_exchange_rates(self, date_str: str, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        return self._hedged(lambda provider: provider.get_exchange_rates(date_str, base), date_str)
+
+    def get_latest_rates(self, base: str = DEFAULT_BASE_CURRENCY) -> OpenExchangeRatesResponse:
+        return self._hedged(lambda provider: provider.get_latest_rates(base), 'latest')
+
+    def _timed(
+        self, provider: RateProvider, request: Callable[[RateProvider], OpenExchangeRatesResponse]
+    ) -> OpenExchangeRatesResponse:
+        started = time.monotonic()
+        failed = False
+        try:
+            return request(provider)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            latency = time.monotonic() - started
+            with self._stats_lock:
+                stats = self.stats[provider.name]
+                stats.requests += 1
+                if failed:
+                    stats.errors += 1
+                else:
+                    stats.total_latency += latency
+                    stats.max_latency = max(stats.max_latency, latency)
+
+    def _submit(
+        self, provider: RateProvider, request: Callable[[RateProvider], OpenExchangeRatesResponse]
+    ) -> Future[OpenExchangeRatesResponse]:
+        return self._executors[provider.name].submit(self._timed, provider, request)
+
+    def _hedged(
+        self, request: Callable[[RateProvider], OpenExchangeRatesResponse], label: str
+    ) -> OpenExchangeRatesResponse:
+        pending: dict[Future[OpenExchangeRatesResponse], RateProvider] = {}
+        pending[self._submit(self.primary, request)] = self.primary
+        errors: list[str] = []
+        hedged = False
+        while pending:
+            done, _ = wait(pending, timeout=None if hedged else self.hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning(
+                    f'{self.primary.name} did not answer within {self.hedge_after}s for {label}, '
+                    f'hedging with {self.secondary.name}'
+                )
+            if not hedged and (not done or not _succeeded(done)):
+                # Slow or failed primary, from here on the first successful response wins
+                hedged = True
+                pending[self._submit(self.secondary, request)] = self.secondary
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f'{provider.name} failed for {label}: {e}')
+                    errors.append(f'{provider.name}: {e}')
+                    continue
+
+                with self._stats_lock:
+                    self.stats[provider.name].wins += 1
+                if provider is self.secondary:
+                    logger.warning(
+                        f'Rates for {label} come from {provider.name} and may lack currencies, '
+                        f'they are fetched again from {self.primary.name} on the next run'
+                    )
+                for loser in pending:
+                    loser.cancel()
+                return result
+
+        raise ValueError(f'All providers failed for {label}: {"; ".join(errors)}')
+
+    def log_stats(self) -> None:
+        for provider_name, stats in self.stats.items():
+            logger.info(
+                f'{provider_name}: {stats.requests} request(s), {stats.errors} error(s), {stats.wins} win(s), '
+                f'mean latency {stats.mean_latency:.2f}s, max {stats.max_latency:.2f}s'
+            )
+
+    def close(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def build_provider() -> RateProvider:
+    """The configured provider: OpenExchangeRates, hedged with a secondary one if `SECONDARY_PROVIDER` is set."""
+    settings = get_settings()
+    primary = OpenExchangeRatesClient()
+
+    if not settings.secondary_provider:
+        return primary
+    if settings.secondary_provider != FRANKFURTER:
+        raise ValueError(f'Unknown secondary provider {settings.secondary_provider!r}, expected {FRANKFURTER!r}')
+    return HedgedProvider(primary, FrankfurterClient(), hedge_after=settings.hedge_after_seconds)
@@ -0,0 +1,304 @@
+"""Data-quality scan of the loaded daily rates, run after the load.
+
+The date x currency matrix of a window is scanned in one vectorized pass:
+- day-over-day log returns (against the last observed rate, so gaps don't hide a jump),
+- z-scores of each return against the trailing `window` days, flagged as `jump` above `z_threshold`,
+- runs of unchanged rates, flagged as `stale` once they reach `stale_days`.
+
+With change-only storage, moves up to `CHANGE_EPSILON` aren't stored and read back as flat. So in that mode a
+rate counts as unchanged when it moved by at most that much, and `stale` means "hasn't moved more than the
+storage tolerance" rather than "didn't move at all".
+
+Flagged points are written to the `anomalies` table, replacing earlier results of the scanned range.
+"""
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime, timedelta
+from typing import Annotated, Optional
+
+import numpy as np
+import typer
+
+from currensee import delta
+from currensee.config import get_settings
+from currensee.constants import DAILY_KEY_FORMAT
+from currensee.logging_config import setup_logging
+from currensee.query import RateMatrix, RateQuery, fill_forward
+
+setup_logging()
+logger = logging.getLogger('currensee.quality')
+app = typer.Typer()
+
+KIND_JUMP = 'jump'
+KIND_STALE = 'stale'
+
+# Exit code of the CLI when more anomalies than allowed were found (1 is used for job failures)
+ANOMALIES_EXIT_CODE = 2
+
+# Floor of the trailing volatility, otherwise the first tiny move after a flat window has an infinite z-score
+MIN_VOLATILITY = 1e-4
+
+
+@dataclass
+class ScanOptions:
+    window: int = 30
+    z_threshold: float = 6.0
+    stale_days: int = 7
+    exclude: list[str] = field(default_factory=list)
+    dry_run: bool = False
+    # Largest relative move still counted as unchanged, None for CHANGE_EPSILON with change-only storage, else 0
+    tolerance: float | None = None
+
+
+@dataclass
+class Anomaly:
+    base_currency: str
+    target_currency: str
+    date: str
+    kind: str
+    rate: float
+    score: float  # z-score of a jump, length in days of a stale run
+
+
+def log_returns(rates: np.ndarray) -> np.ndarray:
+    """Log return of every observed rate against the previous observed one, NaN where there is none."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(rates)
+    returns: np.ndarray = np.full_like(logs, np.nan)
+    returns[1:] = logs[1:] - fill_forward(logs)[:-1]
+    return returns
+
+
+def rolling_zscores(returns: np.ndarray, window: int) -> np.ndarray:
+    """Z-score of every return against the returns of the `window` days before it.
+
+    Trailing sums come from cumulative sums, so the cost doesn't depend on the window. Days with fewer than
+    half a window of observed returns before them get NaN.
+    """
+    observed = ~np.isnan(returns)
+    values = np.where(observed, returns, 0.0)
+    end = np.arange(len(returns))
+    start = np.maximum(end - window, 0)
+
+    def trailing_sum(x: np.ndarray) -> np.ndarray:
+        cumulative = np.zeros((len(x) + 1, x.shape[1]))
+        np.cumsum(x, axis=0, out=cumulative[1:])
+        return cumulative[end] - cumulative[start]
+
+    count = trailing_sum(observed.astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = trailing_sum(values) / count
+        variance = trailing_sum(values**2) / count - mean**2
+        zscores: np.ndarray = (returns - mean) / np.maximum(np.sqrt(np.maximum(variance, 0.0)), MIN_VOLATILITY)
+    zscores[count < max(window // 2, 2)] = np.nan
+    return zscores
+
+
+def stale_runs(returns: np.ndarray, tolerance: float = 0.0) -> np.ndarray:
+    """Number of consecutive unchanged rates ending on every day, days without a rate don't break a run.
+
+    A return counts as unchanged when the rate moved by at most `tolerance` (relative).
+    """
+    with np.errstate(invalid='ignore'):
+        unchanged = np.abs(returns) <= np.log1p(tolerance)
+    moved = ~np.isnan(returns) & ~unchanged
+    count = np.cumsum(unchanged, axis=0)
+    return count - np.maximum.accumulate(np.where(moved, count, 0), axis=0)
+
+
+def scan_matrix(matrix: RateMatrix, base_currency: str, options: ScanOptions, scan_from: date) -> list[Anomaly]:
+    """Flag the anomalies of the matrix on or after `scan_from`, earlier rows only warm up the statistics."""
+    keep = [i for i, currency in enumerate(matrix.currencies) if currency not in options.exclude]
+    currencies = [matrix.currencies[i] for i in keep]
+    rates = matrix.rates[:, keep]
+
+    returns = log_returns(rates)
+    zscores = rolling_zscores(returns, options.window)
+    runs = stale_runs(returns, options.tolerance or 0.0)
+
+    in_scan = (matrix.dates >= np.datetime64(scan_from, 'D'))[:, None]
+    with np.errstate(invalid='ignore'):
+        jumps = in_scan & (np.abs(zscores) > options.z_threshold)
+        # A day without a rate carries the run on, flag the run on the day it reaches the threshold only
+        stale = in_scan & (runs == options.stale_days) & ~np.isnan(returns)
+
+    days = np.datetime_as_string(matrix.dates)
+    anomalies = []
+    for kind, flagged, scores in ((KIND_JUMP, jumps, zscores), (KIND_STALE, stale, runs)):
+        for day_idx, currency_idx in zip(*np.nonzero(flagged), strict=True):
+            anomalies.append(
+                Anomaly(
+                    base_currency=base_currency,
+                    target_currency=currencies[currency_idx],
+                    date=str(days[day_idx]),
+                    kind=kind,
+                    rate=float(rates[day_idx, currency_idx]),
+                    score=float(scores[day_idx, currency_idx]),
+                )
+            )
+    return anomalies
+
+
+def save_anomalies(db_path: str, base_currency: str, date_from: date, date_to: date, anomalies: list[Anomaly]) -> None:
+    """Replace the anomalies of the scanned base currency and range."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                """
+            CREATE TABLE IF NOT EXISTS anomalies (
+                base_currency TEXT NOT NULL,
+                target_currency TEXT NOT NULL,
+                date TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                rate REAL NOT NULL,
+                score REAL NOT NULL,
+                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (base_currency, target_currency, date, kind)
+            )
+            """
+            )
+            conn.execute(
+                'DELETE FROM anomalies WHERE base_currency = ? AND date BETWEEN ? AND ?',
+                (base_currency, date_from.strftime(DAILY_KEY_FORMAT), date_to.strftime(DAILY_KEY_FORMAT)),
+            )
+            conn.executemany(
+                """
+            INSERT INTO anomalies (base_currency, target_currency, date, kind, rate, score)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+                [(a.base_currency, a.target_currency, a.date, a.kind, a.rate, a.score) for a in anomalies],
+            )
+    finally:
+        conn.close()
+
+
+def run_scan(
+    date_from: date,
+    date_to: date,
+    options: ScanOptions | None = None,
+    base_currencies: list[str] | None = None,
+    db_path_str: str | None = None,
+) -> list[Anomaly]:
+    """Scan the daily rates of every base currency between `date_from` and `date_to`.
+
+    The matrix is read from a warm-up period before `date_from`, so the first scanned days have full
+    trailing statistics and a stale run that started before the range isn't flagged again.
+    """
+    settings = get_settings()
+    options = options or ScanOptions()
+    db_path = db_path_str or settings.db_path
+    warm_up_from = date_from - timedelta(days=max(options.window, options.stale_days) + 1)
+
+    anomalies: list[Anomaly] = []
+    query = RateQuery(db_path, pool_size=1)
+    try:
+        if options.tolerance is None:
+            with query.pool.connection() as conn:
+                changes_only = delta.get_storage_mode(conn.cursor()) == delta.STORAGE_CHANGES
+            options = replace(options, tolerance=settings.change_epsilon if changes_only else 0.0)
+        for base in base_currencies or settings.base_currencies:
+            started = time.monotonic()
+            matrix = query.get_matrix(warm_up_from, date_to, base)
+            found = scan_matrix(matrix, base, options, date_from)
+            logger.info(
+                f'Scanned {base}: {len(matrix.dates)} day(s) x {len(matrix.currencies)} currencies in '
+                f'{time.monotonic() - started:.2f}s, {len(found)} anomaly(ies)'
+            )
+
+            if options.dry_run:
+                logger.info(f'[DRY RUN] Would save {len(found)} anomaly(ies) for {base}')
+            else:
+                save_anomalies(db_path, base, date_from, date_to, found)
+            anomalies.extend(found)
+    finally:
+        query.close()
+
+    return anomalies
+
+
+@app.command()
+def main(  # noqa: PLR0913
+    date_from: Annotated[
+        Optional[datetime],  # noqa: UP007
+        typer.Option(formats=['%Y-%m-%d'], help='Start date in YYYY-MM-DD format. Required if --date-to is set.'),
+    ] = None,
+    date_to: Annotated[
+        Optional[datetime],  # noqa: UP007
+        typer.Option(formats=['%Y-%m-%d'], help='End date in YYYY-MM-DD format. Required if --date-from is set.'),
+    ] = None,
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+    base: Annotated[
+        Optional[list[str]],  # noqa: UP007
+        typer.Option('--base', help='Base currency to scan, can be repeated (default: from config).'),
+    ] = None,
+    window: Annotated[int, typer.Option('--window', help='Trailing days of the rolling z-score.')] = 30,
+    z_threshold: Annotated[float, typer.Option('--z-threshold', help='Z-score above which a return is a jump.')] = 6.0,
+    stale_days: Annotated[
+        int, typer.Option('--stale-days', help='Unchanged days after which a rate is flagged as stale.')
+    ] = 7,
+    exclude: Annotated[
+        Optional[list[str]],  # noqa: UP007
+        typer.Option('--exclude', help='Currency to skip (e.g. a pegged one), can be repeated.'),
+    ] = None,
+    max_anomalies: Annotated[
+        int, typer.Option('--max-anomalies', help='Exit with code 2 if more anomalies than this are found.')
+    ] = 0,
+    dry_run: Annotated[bool, typer.Option('--dry-run', help='Scan without writing to the anomalies table.')] = False,
+) -> None:
+    """Scan the loaded rates for jumps and stale values and record them in the anomalies table.
+
+    If no dates are provided, defaults to today's date for both start and end.
+    If either --date-from or --date-to is provided, both must be specified.
+    """
+    if date_from is None and date_to is None:
+        date_from_date = date_to_date = date.today()
+        logger.info(f'No dates provided, defaulting to today: {date_from_date.strftime("%Y-%m-%d")}')
+    elif date_from is None or date_to is None:
+        logger.error('Both --date-from and --date-to must be provided if either is set.')
+        raise typer.Exit(code=1)
+    else:
+        date_from_date = date_from.date()
+        date_to_date = date_to.date()
+
+    if date_from_date > date_to_date:
+        logger.error(f'Start date {date_from_date} cannot be after end date {date_to_date}.')
+        raise typer.Exit(code=1)
+
+    options = ScanOptions(
+        window=window,
+        z_threshold=z_threshold,
+        stale_days=stale_days,
+        exclude=[currency.upper() for currency in exclude or []],
+        dry_run=dry_run,
+    )
+    try:
+        anomalies = run_scan(
+            date_from_date,
+            date_to_date,
+            options,
+            base_currencies=[b.upper() for b in base] if base else None,
+            db_path_str=db_path,
+        )
+    except (ValueError, FileNotFoundError, sqlite3.Error) as e:
+        logger.error(f'Quality scan failed: {e}')
+        raise typer.Exit(code=1) from e
+
+    for anomaly in anomalies:
+        logger.warning(
+            f'{anomaly.kind} {anomaly.base_currency}/{anomaly.target_currency} on {anomaly.date}: '
+            f'rate {anomaly.rate:.6g}, score {anomaly.score:.1f}'
+        )
+
+    if len(anomalies) > max_anomalies:
+        logger.error(f'Found {len(anomalies)} anomaly(ies), more than the allowed {max_anomalies}')
+        raise typer.Exit(code=ANOMALIES_EXIT_CODE)
+    logger.info(f'Found {len(anomalies)} anomaly(ies), within the allowed {max_anomalies}')
+
+
+if __name__ == '__main__':
+    app()
@@ -0,0 +1,285 @@
+"""Read-only query API over the exchange rates database."""
+import logging
+import queue
+import sqlite3
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from functools import cache
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+import numpy as np
+
+from currensee import delta
+from currensee.config import get_settings
+from currensee.constants import DAILY_KEY_FORMAT, DEFAULT_BASE_CURRENCY
+
+logger = logging.getLogger('currensee.query')
+
+# Statements are kept as constants so every call hits the per-connection statement cache. Day and matrix
+# queries disable the base_currency index with a unary `+`, seeking by date is far more selective.
+RATE_SQL = 'SELECT rate FROM exchange_rates WHERE base_currency = ? AND target_currency = ? AND date = ?'
+DAY_SQL = 'SELECT target_currency, rate FROM exchange_rates WHERE +base_currency = ? AND date = ?'
+SERIES_SQL = """
+SELECT date, rate FROM exchange_rates
+WHERE base_currency = ? AND target_currency = ? AND date BETWEEN ? AND ?
+ORDER BY date
+"""
+MATRIX_SQL = """
+SELECT date, target_currency, rate FROM exchange_rates
+WHERE +base_currency = ? AND date BETWEEN ? AND ?
+"""
+
+# Change-only storage (see currensee.delta): rates are the last stored ones on or before a loaded day
+LOADED_DAY_SQL = f'SELECT 1 FROM {delta.LOADED_DAYS_TABLE} WHERE base_currency = ? AND date = ?'
+LOADED_DAYS_SQL = f'SELECT date FROM {delta.LOADED_DAYS_TABLE} WHERE base_currency = ? AND date BETWEEN ? AND ?'
+AS_OF_RATE_SQL = """
+SELECT date, rate FROM exchange_rates
+WHERE base_currency = ? AND target_currency = ? AND date <= ?
+ORDER BY date DESC LIMIT 1
+"""
+
+
+@dataclass
+class RateSeries:
+    currency: str
+    dates: np.ndarray  # datetime64[D]
+    rates: np.ndarray  # float64
+
+    def to_arrow(self) -> Any:
+        """Return the series as a `pyarrow.Table` (requires the optional pyarrow dependency)."""
+        import pyarrow as pa
+
+        return pa.table({'date': self.dates, 'rate': self.rates})
+
+
+@dataclass
+class RateMatrix:
+    """Rates of a date range as a date x currency matrix, missing rates are NaN."""
+
+    dates: np.ndarray  # datetime64[D], every calendar day of the range
+    currencies: list[str]
+    rates: np.ndarray  # float64, shape (len(dates), len(currencies))
+
+
+class ConnectionPool:
+    """A small pool of read-only SQLite connections that can be shared between threads.
+
+    Connections are opened with a `mode=ro` URI and `query_only`, so a consumer can never write to the
+    database. The loader keeps the database in WAL mode, which lets these readers run while a load is in
+    progress: they keep seeing the last committed state until the load commits.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, cached_statements: int = 64, timeout: float = 30.0) -> None:
+        path = Path(db_path).resolve()
+        if not path.exists():
+            raise FileNotFoundError(f'No database found at {path}')
+
+        self.uri = f'file:{quote(path.as_posix())}?mode=ro'
+        self.size = size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.uri,
+            uri=True,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute('PRAGMA query_only = ON')
+        logger.debug(f'Opened read-only connection {self._opened}/{self.size} to {self.uri}')
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection, opening a new one while the pool is below its size."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except BaseException:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=self.timeout)
+
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+class RateQuery:
+    """Point, day, series and matrix lookups of daily rates.
+
+    With change-only storage the rates of loaded days are reconstructed from the last stored change. A
+    currency missing from a loaded day then still has a rate (its last stored one) where full storage has
+    none (None, a missing key or NaN), so results only match across modes for currencies published every day.
+    """
+
+    def __init__(self, db_path: str | None = None, pool_size: int = 4) -> None:
+        self.pool = ConnectionPool(db_path or get_settings().db_path, size=pool_size)
+        self.changes_only = False
+
+    def _changes_only(self, conn: sqlite3.Connection) -> bool:
+        # `delta compact` can convert the database while it is being read, and there is no way back
+        if not self.changes_only:
+            self.changes_only = delta.get_storage_mode(conn.cursor()) == delta.STORAGE_CHANGES
+        return self.changes_only
+
+    def get_rate(self, currency: str, on: date, base_currency: str = DEFAULT_BASE_CURRENCY) -> float | None:
+        day = on.strftime(DAILY_KEY_FORMAT)
+        with self.pool.connection() as conn:
+            if not self._changes_only(conn):
+                row = conn.execute(RATE_SQL, (base_currency, currency, day)).fetchone()
+                return float(row[0]) if row else None
+            if conn.execute(LOADED_DAY_SQL, (base_currency, day)).fetchone() is None:
+                return None
+            row = conn.execute(AS_OF_RATE_SQL, (base_currency, currency, day)).fetchone()
+        return float(row[1]) if row else None
+
+    def get_day(self, on: date, base_currency: str = DEFAULT_BASE_CURRENCY) -> dict[str, float]:
+        day = on.strftime(DAILY_KEY_FORMAT)
+        with self.pool.connection() as conn:
+            if not self._changes_only(conn):
+                return dict(conn.execute(DAY_SQL, (base_currency, day)).fetchall())
+            if conn.execute(LOADED_DAY_SQL, (base_currency, day)).fetchone() is None:
+                return {}
+            return delta.as_of(conn.cursor(), base_currency, day)
+
+    def get_series(
+        self, currency: str, date_from: date, date_to: date, base_currency: str = DEFAULT_BASE_CURRENCY
+    ) -> RateSeries:
+        """Rates of one currency for the days that have one, as NumPy arrays."""
+        day_from, day_to = date_from.strftime(DAILY_KEY_FORMAT), date_to.strftime(DAILY_KEY_FORMAT)
+        with self.pool.connection() as conn:
+            changes_only = self._changes_only(conn)
+            rows = conn.execute(SERIES_SQL, (base_currency, currency, day_from, day_to)).fetchall()
+            if changes_only:
+                baseline = conn.execute(AS_OF_RATE_SQL, (base_currency, currency, day_from)).fetchone()
+                loaded = conn.execute(LOADED_DAYS_SQL, (base_currency, day_from, day_to)).fetchall()
+
+        dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+        rates = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        if not changes_only:
+            return RateSeries(currency=currency, dates=dates, rates=rates)
+
+        if baseline is not None and baseline[0] < day_from:
+            dates = np.concatenate([np.array([baseline[0]], dtype='datetime64[D]'), dates])
+            rates = np.concatenate([[baseline[1]], rates])
+        loaded_dates = np.sort(np.array([row[0] for row in loaded], dtype='datetime64[D]'))
+        # Position of the last stored change on or before every loaded day, -1 if there is none yet
+        positions = np.searchsorted(dates, loaded_dates, side='right') - 1
+        known = positions >= 0
+        return RateSeries(currency=currency, dates=loaded_dates[known], rates=rates[positions[known]])
+
+    def get_matrix(self, date_from: date, date_to: date, base_currency: str = DEFAULT_BASE_CURRENCY) -> RateMatrix:
+        """All currencies for every calendar day of the range as a dense matrix."""
+        day_from, day_to = date_from.strftime(DAILY_KEY_FORMAT), date_to.strftime(DAILY_KEY_FORMAT)
+        baseline: dict[str, float] = {}
+        with self.pool.connection() as conn:
+            changes_only = self._changes_only(conn)
+            rows = conn.execute(MATRIX_SQL, (base_currency, day_from, day_to)).fetchall()
+            if changes_only:
+                baseline = delta.as_of(conn.cursor(), base_currency, day_from, inclusive=False)
+                loaded = conn.execute(LOADED_DAYS_SQL, (base_currency, day_from, day_to)).fetchall()
+
+        dates = np.arange(np.datetime64(date_from, 'D'), np.datetime64(date_to, 'D') + 1)
+        if not rows and not baseline:
+            return RateMatrix(dates=dates, currencies=[], rates=np.empty((len(dates), 0)))
+
+        count = len(rows)
+        currencies = sorted({row[1] for row in rows} | baseline.keys())
+        # Positions through dict lookups, much cheaper than parsing a million date strings
+        date_pos = {day: i for i, day in enumerate(np.datetime_as_string(dates).tolist())}
+        currency_pos = {currency: i for i, currency in enumerate(currencies)}
+        date_idx = np.fromiter((date_pos[row[0]] for row in rows), dtype=np.intp, count=count)
+        currency_idx = np.fromiter((currency_pos[row[1]] for row in rows), dtype=np.intp, count=count)
+
+        rates = np.full((len(dates), len(currencies)), np.nan)
+        rates[date_idx, currency_idx] = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+        if changes_only:
+            rates = _fill_forward(rates, baseline, currency_pos)
+            loaded_dates = np.array([row[0] for row in loaded], dtype='datetime64[D]')
+            rates[~np.isin(dates, loaded_dates)] = np.nan
+        return RateMatrix(dates=dates, currencies=currencies, rates=rates)
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def fill_forward(values: np.ndarray) -> np.ndarray:
+    """Replace NaNs by the last value above them in the same column (NaN if there is none)."""
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled: np.ndarray = values[rows, np.arange(values.shape[1])]
+    return filled
+
+
+def _fill_forward(rates: np.ndarray, baseline: dict[str, float], currency_pos: dict[str, int]) -> np.ndarray:
+    """Carry the last stored change of every currency (starting from `baseline`) down the matrix."""
+    start = np.full((1, rates.shape[1]), np.nan)
+    for currency, rate in baseline.items():
+        start[0, currency_pos[currency]] = rate
+    return fill_forward(np.vstack([start, rates]))[1:]
+
+
+@cache
+def _default_query(db_path: str) -> RateQuery:
+    return RateQuery(db_path)
+
+
+def _query(db_path: str | None) -> RateQuery:
+    return _default_query(db_path or get_settings().db_path)
+
+
+def get_rate(
+    currency: str, on: date, base_currency: str = DEFAULT_BASE_CURRENCY, db_path: str | None = None
+) -> float | None:
+    return _query(db_path).get_rate(currency, on, base_currency)
+
+
+def get_day(on: date, base_currency: str = DEFAULT_BASE_CURRENCY, db_path: str | None = None) -> dict[str, float]:
+    return _query(db_path).get_day(on, base_currency)
+
+
+def get_series(
+    currency: str,
+    date_from: date,
+    date_to: date,
+    base_currency: str = DEFAULT_BASE_CURRENCY,
+    db_path: str | None = None,
+) -> RateSeries:
+    return _query(db_path).get_series(currency, date_from, date_to, base_currency)
+
+
+def get_matrix(
+    date_from: date, date_to: date, base_currency: str = DEFAULT_BASE_CURRENCY, db_path: str | None = None
+) -> RateMatrix:
+    return _query(db_path).get_matrix(date_from, date_to, base_currency)
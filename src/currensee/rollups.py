@@ -0,0 +1,371 @@
+"""Monthly and yearly rollups of the daily exchange rates, maintained incrementally by the loader."""
+import logging
+import sqlite3
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Annotated, Optional
+
+import typer
+
+from currensee import delta
+from currensee.config import get_settings
+from currensee.constants import DEFAULT_BASE_CURRENCY
+from currensee.delta import RateRow
+from currensee.logging_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger('currensee.rollups')
+app = typer.Typer()
+
+MONTHLY = 'monthly'
+QUARTERLY = 'quarterly'
+YEARLY = 'yearly'
+PERIODS = (MONTHLY, QUARTERLY, YEARLY)
+
+# Rollup kind -> (table, length of the period prefix of a YYYY-MM-DD date)
+ROLLUP_TABLES = {
+    MONTHLY: ('exchange_rates_monthly', 7),
+    YEARLY: ('exchange_rates_yearly', 4),
+}
+
+# End-of-period rate, as of the period's last day so it also works with change-only storage
+LAST_RATE_SQL = """
+SELECT rate FROM exchange_rates
+WHERE base_currency = {base} AND target_currency = {target} AND date <= {day}
+ORDER BY date DESC LIMIT 1
+"""
+
+
+@dataclass
+class RollupStats:
+    period: str
+    average: float
+    minimum: float
+    maximum: float
+    end_of_period_rate: float
+    end_of_period_date: str
+    count: int
+
+
+def init_rollup_tables(cursor: sqlite3.Cursor) -> None:
+    """Create the rollup tables, backfilling them from `exchange_rates` when they are new."""
+    for table, _ in ROLLUP_TABLES.values():
+        cursor.execute(
+            f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            base_currency TEXT NOT NULL,
+            target_currency TEXT NOT NULL,
+            period TEXT NOT NULL,
+            rate_sum REAL NOT NULL,
+            rate_count INTEGER NOT NULL,
+            rate_min REAL NOT NULL,
+            rate_max REAL NOT NULL,
+            last_date TEXT NOT NULL,
+            last_rate REAL NOT NULL,
+            PRIMARY KEY (base_currency, target_currency, period)
+        ) WITHOUT ROWID
+        """
+        )
+
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {ROLLUP_TABLES[MONTHLY][0]})')
+    rollups_empty = not cursor.fetchone()[0]
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM exchange_rates)')
+    if rollups_empty and cursor.fetchone()[0]:
+        logger.info('Rollup tables are empty, building them from existing exchange rates')
+        rebuild_rollup_tables(cursor)
+
+
+def add_rates(cursor: sqlite3.Cursor, rows: Iterable[RateRow]) -> None:
+    """Fold newly inserted rates into the rollups using running sums and counts."""
+    rows = list(rows)
+    for table, prefix_len in ROLLUP_TABLES.values():
+        cursor.executemany(
+            f"""
+        INSERT INTO {table}
+            (base_currency, target_currency, period, rate_sum, rate_count, rate_min, rate_max, last_date, last_rate)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT (base_currency, target_currency, period) DO UPDATE SET
+            rate_sum = rate_sum + excluded.rate_sum,
+            rate_count = rate_count + 1,
+            rate_min = MIN(rate_min, excluded.rate_min),
+            rate_max = MAX(rate_max, excluded.rate_max),
+            last_rate = CASE WHEN excluded.last_date >= last_date THEN excluded.last_rate ELSE last_rate END,
+            last_date = MAX(last_date, excluded.last_date)
+        """,
+            [(base, target, day[:prefix_len], rate, rate, rate, day, rate) for base, target, rate, day in rows],
+        )
+
+
+def remove_rates(cursor: sqlite3.Cursor, rows: Iterable[RateRow]) -> None:
+    """Retract rates that were deleted from `exchange_rates`.
+
+    Sums and counts are adjusted in place. Min, max and the end-of-period rate can't be un-applied, so when a
+    removed rate was one of them they are re-read from `exchange_rates` for that single currency and period.
+    Must be called after the rows are gone from `exchange_rates`.
+    """
+    rows = list(rows)
+    for kind, (table, prefix_len) in ROLLUP_TABLES.items():
+        for base, target, rate, day in rows:
+            key = (base, target, day[:prefix_len])
+            cursor.execute(
+                f"""
+            UPDATE {table} SET rate_sum = rate_sum - ?, rate_count = rate_count - 1
+            WHERE base_currency = ? AND target_currency = ? AND period = ?
+            """,
+                (rate, *key),
+            )
+            cursor.execute(
+                f"""
+            SELECT rate_count, rate_min, rate_max, last_date FROM {table}
+            WHERE base_currency = ? AND target_currency = ? AND period = ?
+            """,
+                key,
+            )
+            updated = cursor.fetchone()
+            if updated is None:
+                continue
+
+            rate_count, rate_min, rate_max, last_date = updated
+            if rate_count <= 0:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE base_currency = ? AND target_currency = ? AND period = ?', key
+                )
+            elif rate in (rate_min, rate_max) or day == last_date:
+                _refresh_extremes(cursor, kind, key)
+
+
+def _period_bounds(kind: str, period: str) -> tuple[str, str]:
+    if kind == YEARLY:
+        return f'{period}-01-01', f'{period}-12-31'
+    return f'{period}-01', f'{period}-31'
+
+
+def _daily_rates(cursor: sqlite3.Cursor) -> str:
+    """Table or view holding one row per currency and loaded day."""
+    return delta.ASOF_VIEW if delta.get_storage_mode(cursor) == delta.STORAGE_CHANGES else 'exchange_rates'
+
+
+def _refresh_extremes(cursor: sqlite3.Cursor, kind: str, key: tuple[str, str, str]) -> None:
+    table, _ = ROLLUP_TABLES[kind]
+    base, target, period = key
+    start, end = _period_bounds(kind, period)
+
+    currency_rates = """
+    SELECT rate, date FROM exchange_rates
+    WHERE base_currency = :base AND target_currency = :target AND date BETWEEN :date_from AND :date_to
+    """
+    if delta.get_storage_mode(cursor) == delta.STORAGE_CHANGES:
+        currency_rates = delta.CURRENCY_DAILY_RATES_SQL
+    cursor.execute(
+        f'SELECT MIN(rate), MAX(rate), MAX(date) FROM ({currency_rates})',
+        {'base': base, 'target': target, 'date_from': start, 'date_to': end},
+    )
+    rate_min, rate_max, last_date = cursor.fetchone()
+    cursor.execute(
+        f"""
+    UPDATE {table} SET
+        rate_min = ?,
+        rate_max = ?,
+        last_date = ?,
+        last_rate = ({LAST_RATE_SQL.format(base='?', target='?', day='?')})
+    WHERE base_currency = ? AND target_currency = ? AND period = ?
+    """,
+        (rate_min, rate_max, last_date, base, target, last_date, *key),
+    )
+
+
+def rebuild_rollup_tables(cursor: sqlite3.Cursor, date_from: str | None = None, date_to: str | None = None) -> None:
+    """Recompute rollups with one aggregate pass over `exchange_rates` per rollup table.
+
+    With `date_from`/`date_to` (YYYY-MM-DD) only the periods overlapping that range are recomputed. With
+    change-only storage the pass goes over the reconstructed daily rates instead.
+    """
+    daily_rates = _daily_rates(cursor)
+    for kind, (table, prefix_len) in ROLLUP_TABLES.items():
+        params: tuple[str, ...] = ()
+        if date_from is None or date_to is None:
+            cursor.execute(f'DELETE FROM {table}')
+            # A plain table scan beats walking the (non-covering) currency index for a full rebuild
+            source = f'{daily_rates} NOT INDEXED' if daily_rates == 'exchange_rates' else daily_rates
+        else:
+            period_from, period_to = date_from[:prefix_len], date_to[:prefix_len]
+            cursor.execute(f'DELETE FROM {table} WHERE period BETWEEN ? AND ?', (period_from, period_to))
+            source = f'{daily_rates} WHERE date BETWEEN ? AND ?'
+            params = (_period_bounds(kind, period_from)[0], _period_bounds(kind, period_to)[1])
+
+        # The end-of-period rate is looked up through the (base_currency, target_currency, date) unique index
+        last_rate_sql = LAST_RATE_SQL.format(
+            base='grouped.base_currency', target='grouped.target_currency', day='grouped.last_date'
+        )
+        cursor.execute(
+            f"""
+        INSERT INTO {table}
+            (base_currency, target_currency, period, rate_sum, rate_count, rate_min, rate_max, last_date, last_rate)
+        WITH grouped AS (
+            SELECT
+                base_currency,
+                target_currency,
+                substr(date, 1, {prefix_len}) AS period,
+                SUM(rate) AS rate_sum,
+                COUNT(*) AS rate_count,
+                MIN(rate) AS rate_min,
+                MAX(rate) AS rate_max,
+                MAX(date) AS last_date
+            FROM {source}
+            GROUP BY base_currency, target_currency, period
+        )
+        SELECT
+            grouped.*,
+            ({last_rate_sql})
+        FROM grouped
+        """,
+            params,
+        )
+
+
+def rebuild_rollups(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            rebuild_rollup_tables(conn.cursor())
+    finally:
+        conn.close()
+
+
+def _quarter_months(day: date) -> tuple[date, date]:
+    """First days of the first and the last month of the quarter of `day`."""
+    first_month = (day.month - 1) // 3 * 3 + 1
+    return date(day.year, first_month, 1), date(day.year, first_month + 2, 1)
+
+
+def _period_key(kind: str, day: date) -> str:
+    if kind == YEARLY:
+        return f'{day.year:04d}'
+    if kind == QUARTERLY:
+        return f'{day.year:04d}-Q{(day.month - 1) // 3 + 1}'
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+def get_rollups(  # noqa: PLR0913
+    currency: str,
+    period: str = MONTHLY,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    base_currency: str = DEFAULT_BASE_CURRENCY,
+    db_path: str | None = None,
+) -> list[RollupStats]:
+    """Average, min, max and end-of-period rate of a currency per month, quarter or year.
+
+    Periods partially covered by `date_from`/`date_to` are returned whole. Quarters are combined from the
+    monthly rollups.
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Unknown rollup period {period!r}, expected one of {", ".join(PERIODS)}')
+
+    kind = YEARLY if period == YEARLY else MONTHLY
+    table, _ = ROLLUP_TABLES[kind]
+    if period == QUARTERLY:
+        # Widen to whole quarters, the monthly rows are combined into quarters below
+        date_from = _quarter_months(date_from)[0] if date_from else None
+        date_to = _quarter_months(date_to)[1] if date_to else None
+    period_from = _period_key(kind, date_from) if date_from else ''
+    period_to = _period_key(kind, date_to) if date_to else '~'
+
+    conn = sqlite3.connect(db_path or get_settings().db_path)
+    try:
+        rows = conn.execute(
+            f"""
+        SELECT period, rate_sum, rate_count, rate_min, rate_max, last_date, last_rate FROM {table}
+        WHERE base_currency = ? AND target_currency = ? AND period BETWEEN ? AND ?
+        ORDER BY period
+        """,
+            (base_currency, currency, period_from, period_to),
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # period -> (rate_sum, rate_count, rate_min, rate_max, last_date, last_rate)
+    combined: dict[str, tuple[float, int, float, float, str, float]] = {}
+    for period_key, period_sum, period_count, period_min, period_max, last_date, last_rate in rows:
+        key = _period_key(QUARTERLY, date.fromisoformat(f'{period_key}-01')) if period == QUARTERLY else period_key
+        current = combined.get(key)
+        if current is None:
+            combined[key] = (period_sum, period_count, period_min, period_max, last_date, last_rate)
+        else:
+            # Rows are ordered by period, so the later month always carries the end-of-period rate
+            combined[key] = (
+                current[0] + period_sum,
+                current[1] + period_count,
+                min(current[2], period_min),
+                max(current[3], period_max),
+                last_date,
+                last_rate,
+            )
+
+    return [
+        RollupStats(
+            period=key,
+            average=rate_sum / rate_count,
+            minimum=rate_min,
+            maximum=rate_max,
+            end_of_period_rate=last_rate,
+            end_of_period_date=last_date,
+            count=rate_count,
+        )
+        for key, (rate_sum, rate_count, rate_min, rate_max, last_date, last_rate) in combined.items()
+    ]
+
+
+@app.command()
+def rebuild(
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+) -> None:
+    """Recompute the monthly and yearly rollup tables from exchange_rates."""
+    rebuild_rollups(db_path)
+    logger.info(f'Rollup tables rebuilt in {db_path}')
+
+
+@app.command()
+def show(  # noqa: PLR0913
+    currency: Annotated[str, typer.Argument(help='Target currency, e.g. EUR.')],
+    period: Annotated[str, typer.Option('--period', help='One of "monthly", "quarterly" or "yearly".')] = MONTHLY,
+    date_from: Annotated[
+        Optional[datetime],  # noqa: UP007
+        typer.Option(formats=['%Y-%m-%d'], help='Start date in YYYY-MM-DD format.'),
+    ] = None,
+    date_to: Annotated[
+        Optional[datetime],  # noqa: UP007
+        typer.Option(formats=['%Y-%m-%d'], help='End date in YYYY-MM-DD format.'),
+    ] = None,
+    base: Annotated[str, typer.Option('--base', help='Base currency.')] = DEFAULT_BASE_CURRENCY,
+    db_path: Annotated[
+        str, typer.Option('--db-path', help='Path to the SQLite database file (default: from config).')
+    ] = get_settings().db_path,
+) -> None:
+    """Print average, min, max and end-of-period rates of a currency from the rollup tables."""
+    try:
+        stats = get_rollups(
+            currency.upper(),
+            period=period,
+            date_from=date_from.date() if date_from else None,
+            date_to=date_to.date() if date_to else None,
+            base_currency=base.upper(),
+            db_path=db_path,
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        raise typer.Exit(code=1) from e
+
+    typer.echo('period\tavg\tmin\tmax\tend\tdays')
+    for row in stats:
+        typer.echo(
+            f'{row.period}\t{row.average:.6f}\t{row.minimum:.6f}\t{row.maximum:.6f}\t'
+            f'{row.end_of_period_rate:.6f}\t{row.count}'
+        )
+
+
+if __name__ == '__main__':
+    app()
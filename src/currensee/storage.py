@@ -1,9 +1,27 @@
 """Storage module for the CurrenSee application."""
 import json
+import logging
+import os
+import tempfile
+from collections.abc import Iterator
+from contextlib import AbstractContextManager, contextmanager
 from pathlib import Path
-from typing import Any, Protocol
+from typing import IO, Any, Protocol
 
 from currensee.config import get_settings
+from currensee.constants import DEFAULT_BASE_CURRENCY, GRANULARITY_HOURLY
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger('currensee.storage')
+
+FSYNC_NONE = 'none'
+FSYNC_EACH = 'each'
+FSYNC_BATCH = 'batch'
+FSYNC_MODES = (FSYNC_NONE, FSYNC_EACH, FSYNC_BATCH)
 
 
 class StorageWriter(Protocol):
@@ -22,15 +40,54 @@ class StorageWriter(Protocol):
     def get_path(self, date_str: str) -> str:
         ...
 
+    def lock(self, date_str: str) -> AbstractContextManager[bool]:
+        """Context manager yielding True if the caller now owns the date, False if another process does."""
+        ...
+
+    def flush(self) -> None:
+        ...
+
 
 class LocalStorageWriter:
-    def __init__(self, base_path: str | None = None, stage_dir: str | None = None) -> None:
+    """Writes raw JSON files to the local filesystem.
+
+    Files are written to a temporary file in the target directory and atomically renamed into place, so a
+    reader never sees a partially written `{date}.json`. The `fsync` mode controls durability:
+    - `none`: rely on the OS page cache (survives process crashes, not power loss)
+    - `each`: fsync the file and its directory on every write
+    - `batch`: fsync each file before the rename, but defer the directory fsync to `flush()`
+
+    One writer handles a single granularity and base currency. Daily files live in `stage_dir`, hourly ones in
+    `hourly_stage_dir`, and every base other than USD gets its own `{base}/` subdirectory, so the layout of
+    existing USD data doesn't change.
+    """
+
+    def __init__(
+        self,
+        base_path: str | None = None,
+        stage_dir: str | None = None,
+        fsync: str | None = None,
+        base_currency: str = DEFAULT_BASE_CURRENCY,
+    ) -> None:
         settings = get_settings()
         self.base_path = base_path or settings.storage_base_path
         self.stage_dir = stage_dir or settings.stage_dir
+        self.base_currency = base_currency
+        self.fsync = fsync or settings.storage_fsync
+        if self.fsync not in FSYNC_MODES:
+            raise ValueError(f'Unknown fsync mode {self.fsync!r}, expected one of {", ".join(FSYNC_MODES)}')
+        self._pending_dirs: set[Path] = set()
+
+    @classmethod
+    def for_granularity(cls, granularity: str, base_currency: str = DEFAULT_BASE_CURRENCY) -> 'LocalStorageWriter':
+        settings = get_settings()
+        stage_dir = settings.hourly_stage_dir if granularity == GRANULARITY_HOURLY else settings.stage_dir
+        return cls(stage_dir=stage_dir, base_currency=base_currency)
 
     def get_path(self, date_str: str) -> str:
         stage_path = Path(self.stage_dir.lstrip('/'))
+        if self.base_currency != DEFAULT_BASE_CURRENCY:
+            stage_path = stage_path / self.base_currency
         full_path = Path(self.base_path) / stage_path / f'{date_str}.json'
         return str(full_path)
 
@@ -38,6 +95,43 @@ class LocalStorageWriter:
         path = Path(self.get_path(date_str))
         return path.exists()
 
+    @contextmanager
+    def lock(self, date_str: str) -> Iterator[bool]:
+        """Take a non-blocking advisory lock on a date so parallel extract runs don't fetch it twice.
+
+        The lock lives in a `.{date}.lock` file next to the data file and is released by the OS if the
+        process dies, so a crashed worker never leaves a date blocked. The owner removes the temporary files
+        a killed writer of the date left behind, and deletes the lock file before releasing it. A process
+        that locked the deleted file notices it's no longer the one at the path and locks the new file.
+        """
+        if fcntl is None:
+            yield True
+            return
+
+        lock_path = Path(self.get_path(date_str)).with_name(f'.{date_str}.lock')
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+        while True:
+            lock_file = open(lock_path, 'a')
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                yield False
+                return
+            if _is_same_file(lock_file, lock_path):
+                break
+            lock_file.close()
+
+        try:
+            for orphan in lock_path.parent.glob(f'.{date_str}.*.tmp'):
+                logger.info(f'Removing {orphan} left behind by an interrupted write')
+                orphan.unlink(missing_ok=True)
+            yield True
+        finally:
+            lock_path.unlink(missing_ok=True)
+            lock_file.close()  # releases the lock
+
     def write(
         self,
         data: dict[str, Any],
@@ -53,8 +147,55 @@ class LocalStorageWriter:
         if not dry_run:
             file_path = Path(path)
             file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._atomic_write(file_path, data)
+
+        return path
+
+    def flush(self) -> None:
+        """Fsync directories with renames pending from `batch` mode writes."""
+        for directory in self._pending_dirs:
+            _fsync_dir(directory)
+        self._pending_dirs.clear()
 
-            with open(file_path, 'w') as f:
+    def _atomic_write(self, file_path: Path, data: dict[str, Any]) -> None:
+        fd, tmp_name = tempfile.mkstemp(dir=file_path.parent, prefix=f'.{file_path.stem}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
                 json.dump(data, f, indent=2)
+                if self.fsync != FSYNC_NONE:
+                    _fsync_file(f)
+            # mkstemp creates files as 0600, keep the permissions a plain open() would have given
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, file_path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
 
-        return path
+        if self.fsync == FSYNC_EACH:
+            _fsync_dir(file_path.parent)
+        elif self.fsync == FSYNC_BATCH:
+            self._pending_dirs.add(file_path.parent)
+
+
+def _is_same_file(f: IO[str], path: Path) -> bool:
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def _fsync_file(f: IO[str]) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError as e:  # pragma: no cover - e.g. Windows can't open directories
+        logger.debug(f'Cannot fsync directory {directory}: {e}')
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -2,32 +2,56 @@ import json
 import logging
 import sqlite3
 from dataclasses import dataclass
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from pathlib import Path
 from typing import Annotated, Any, Optional, cast
 
 import typer
 from pydantic import ValidationError
 
+from currensee import delta, rollups
 from currensee.config import get_settings
 from currensee.constants import (
     API_BASE,
     API_RATES,
     API_TIMESTAMP,
     BASE_CURRENCY,
+    DAILY_KEY_FORMAT,
     DATE,
+    GRANULARITIES,
+    GRANULARITY_DAILY,
+    GRANULARITY_HOURLY,
+    HOURLY_KEY_FORMAT,
     RATE,
     TARGET_CURRENCY,
 )
-from currensee.extract import date_range
+from currensee.extract import RateSelection, date_range, period_keys
 from currensee.logging_config import setup_logging
 from currensee.models import ExchangeRateRecord
+from currensee.providers import is_fallback
 from currensee.storage import LocalStorageWriter
 
 setup_logging()
 logger = logging.getLogger('currensee.transform_load')
 app = typer.Typer()
 
+HOURLY_TABLE = 'exchange_rates_hourly'
+
+# Daily rates loaded from a secondary provider, replaced as soon as the primary provider's data is loaded
+FALLBACK_DAYS_TABLE = 'fallback_days'
+
+# Secondary indexes of exchange_rates, bulk imports drop and recreate them around the load
+EXCHANGE_RATES_INDEXES = {
+    'idx_exchange_rates_date': """
+    CREATE INDEX IF NOT EXISTS idx_exchange_rates_date
+    ON exchange_rates(date)
+    """,
+    'idx_exchange_rates_currencies': """
+    CREATE INDEX IF NOT EXISTS idx_exchange_rates_currencies
+    ON exchange_rates(base_currency, target_currency)
+    """,
+}
+
 
 @dataclass
 class DateRange:
@@ -84,6 +108,7 @@ def transform_data(raw_data: dict[str, Any]) -> list[ExchangeRateRecord]:
                 TARGET_CURRENCY: currency,
                 RATE: rate_value,
                 DATE: record_date,
+                API_TIMESTAMP: raw_data.get(API_TIMESTAMP),
             }
             validated_record = ExchangeRateRecord.model_validate(record_data)
             transformed_records.append(validated_record)
@@ -101,6 +126,9 @@ def init_database(db_path_str: str) -> None:
     conn = sqlite3.connect(db_path_str)
     cursor = conn.cursor()
 
+    # WAL lets readers (see currensee.query) keep querying the last committed data while a load runs
+    cursor.execute('PRAGMA journal_mode = WAL')
+
     cursor.execute(
         """
     CREATE TABLE IF NOT EXISTS exchange_rates (
@@ -115,33 +143,244 @@ def init_database(db_path_str: str) -> None:
     """
     )
 
-    cursor.execute(
-        """
-    CREATE INDEX IF NOT EXISTS idx_exchange_rates_date
-    ON exchange_rates(date)
-    """
-    )
+    for index_sql in EXCHANGE_RATES_INDEXES.values():
+        cursor.execute(index_sql)
 
     cursor.execute(
-        """
-    CREATE INDEX IF NOT EXISTS idx_exchange_rates_currencies
-    ON exchange_rates(base_currency, target_currency)
+        f"""
+    CREATE TABLE IF NOT EXISTS {FALLBACK_DAYS_TABLE} (
+        base_currency TEXT NOT NULL,
+        date TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        PRIMARY KEY (base_currency, date)
+    ) WITHOUT ROWID
     """
     )
 
+    delta.init_delta_tables(cursor, get_settings().storage_mode)
+    rollups.init_rollup_tables(cursor)
+
     conn.commit()
     conn.close()
     logger.info(f'Database schema initialized/verified at {db_path_str}')
 
 
-def load_data(
+def hourly_partition_name(snapshot: date) -> str:
+    """Name of the monthly partition table holding hourly snapshots taken on the given (UTC) date."""
+    return f'{HOURLY_TABLE}_{snapshot.year:04d}_{snapshot.month:02d}'
+
+
+def ensure_hourly_partition(cursor: sqlite3.Cursor, snapshot: date) -> str:
+    """Create the monthly partition for the snapshot if needed and return its name.
+
+    Hourly data is split into one table per month so the recent partition stays small and cheap to query,
+    while the `exchange_rates_hourly` view unions all partitions for queries over the whole history.
+    """
+    table = hourly_partition_name(snapshot)
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    if cursor.fetchone() is not None:
+        return table
+
+    cursor.execute(
+        f"""
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        base_currency TEXT NOT NULL,
+        target_currency TEXT NOT NULL,
+        rate REAL NOT NULL,
+        date TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(base_currency, target_currency, hour)
+    )
+    """
+    )
+    cursor.execute(f'CREATE INDEX {table}_hour ON {table}(hour)')
+
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+        (f'{HOURLY_TABLE}_[0-9]*',),
+    )
+    partitions = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f'DROP VIEW IF EXISTS {HOURLY_TABLE}')
+    cursor.execute(f'CREATE VIEW {HOURLY_TABLE} AS ' + ' UNION ALL '.join(f'SELECT * FROM {p}' for p in partitions))
+
+    logger.info(f'Created hourly partition {table}')
+    return table
+
+
+def _track_fallback(
+    cursor: sqlite3.Cursor, base: str, date_str: str, provider: str | None, force_overwrite: bool
+) -> bool:
+    """Record days loaded from a secondary provider, returns whether the day's stored rates must be replaced.
+
+    Such a day lacks most currencies, so the primary provider's data replaces it even without force_overwrite.
+    """
+    cursor.execute(f'SELECT 1 FROM {FALLBACK_DAYS_TABLE} WHERE base_currency = ? AND date = ?', (base, date_str))
+    from_fallback_before = cursor.fetchone() is not None
+
+    if not is_fallback(provider):
+        if from_fallback_before:
+            logger.info(f'{base} data for {date_str} came from a secondary provider, replacing it')
+            cursor.execute(f'DELETE FROM {FALLBACK_DAYS_TABLE} WHERE base_currency = ? AND date = ?', (base, date_str))
+        return force_overwrite or from_fallback_before
+
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM exchange_rates WHERE base_currency = ? AND date = ?)', (base, date_str)
+    )
+    loaded = cursor.fetchone()[0] or delta.is_loaded(cursor, base, date_str)
+    # Secondary data loaded on top of the primary's without force_overwrite only fills gaps, the day stays primary
+    if from_fallback_before or force_overwrite or not loaded:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {FALLBACK_DAYS_TABLE} (base_currency, date, provider) VALUES (?, ?, ?)',
+            (base, date_str, provider),
+        )
+    return force_overwrite
+
+
+def _insert_daily(
+    cursor: sqlite3.Cursor,
+    transformed_data: list[ExchangeRateRecord],
+    date_str: str,
+    force_overwrite: bool,
+    provider: str | None = None,
+) -> int:
+    base = transformed_data[0].base_currency
+    force_overwrite = _track_fallback(cursor, base, date_str, provider, force_overwrite)
+
+    if delta.get_storage_mode(cursor) == delta.STORAGE_CHANGES:
+        return _insert_daily_changes(cursor, transformed_data, date_str, force_overwrite)
+
+    if force_overwrite:
+        logger.warning(f'Deleting existing {base} data for {date_str} due to force_overwrite')
+        cursor.execute(
+            """
+        SELECT base_currency, target_currency, rate, date FROM exchange_rates
+        WHERE date = ? AND base_currency = ?
+        """,
+            (date_str, base),
+        )
+        replaced_rows = cursor.fetchall()
+        cursor.execute('DELETE FROM exchange_rates WHERE date = ? AND base_currency = ?', (date_str, base))
+        rollups.remove_rates(cursor, replaced_rows)
+        existing_targets: set[str] = set()
+    else:
+        # Rows that are already loaded are skipped, the rollups must only see the ones actually inserted
+        cursor.execute(
+            'SELECT target_currency FROM exchange_rates WHERE date = ? AND base_currency = ?', (date_str, base)
+        )
+        existing_targets = {row[0] for row in cursor.fetchall()}
+
+    records_to_insert = [
+        (
+            record.base_currency,
+            record.target_currency,
+            record.rate,
+            record.record_date.strftime(DAILY_KEY_FORMAT),
+        )
+        for record in transformed_data
+        if record.target_currency not in existing_targets
+    ]
+
+    cursor.executemany(
+        'INSERT INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)',
+        records_to_insert,
+    )
+    rollups.add_rates(cursor, records_to_insert)
+    return len(records_to_insert)
+
+
+def _insert_daily_changes(
+    cursor: sqlite3.Cursor, transformed_data: list[ExchangeRateRecord], date_str: str, force_overwrite: bool
+) -> int:
+    """Change-only counterpart of `_insert_daily`, an already loaded day is skipped as a whole.
+
+    The rollups see the day as `exchange_rates_asof` does: every rate of the day plus the currencies carried
+    over from earlier days, so the incremental rollups match a rebuild.
+    """
+    base = transformed_data[0].base_currency
+    replaced: dict[str, float] = {}
+
+    if delta.is_loaded(cursor, base, date_str):
+        if not force_overwrite:
+            logger.info(f'{base} data for {date_str} is already loaded, skipping...')
+            return 0
+        logger.warning(f'Replacing existing {base} data for {date_str} due to force_overwrite')
+        replaced = delta.as_of(cursor, base, date_str)
+
+    next_day = delta.next_loaded_day(cursor, base, date_str)
+    known_later = delta.as_of(cursor, base, next_day).keys() if next_day else set()
+
+    records = [
+        (record.base_currency, record.target_currency, record.rate, record.record_date.strftime(DAILY_KEY_FORMAT))
+        for record in transformed_data
+    ]
+    rows_written = delta.insert_changes(cursor, records, date_str, get_settings().change_epsilon)
+
+    # A currency new to the later days is carried over to all of them, their periods need a rebuild
+    if next_day and any(target not in known_later for _, target, _, _ in records):
+        cursor.execute(f'SELECT MAX(date) FROM {delta.LOADED_DAYS_TABLE} WHERE base_currency = ?', (base,))
+        rollups.rebuild_rollup_tables(cursor, date_str, cursor.fetchone()[0])
+    else:
+        # Rates within epsilon of the previous one read back as that one, the rollups must see the same values
+        stored = delta.as_of(cursor, base, date_str)
+        rollups.remove_rates(cursor, [(base, target, rate, date_str) for target, rate in replaced.items()])
+        rollups.add_rates(cursor, [(base, target, rate, date_str) for target, rate in stored.items()])
+    logger.debug(f'Stored {rows_written} changed rate(s) out of {len(records)} for {date_str}')
+    return rows_written
+
+
+def _insert_hourly(cursor: sqlite3.Cursor, transformed_data: list[ExchangeRateRecord], force_overwrite: bool) -> int:
+    timestamp = transformed_data[0].rate_timestamp
+    if timestamp is None:
+        raise ValueError('Hourly data needs a snapshot timestamp')
+
+    snapshot = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    hour_key = snapshot.strftime(HOURLY_KEY_FORMAT)
+    table = ensure_hourly_partition(cursor, snapshot.date())
+
+    if force_overwrite:
+        base = transformed_data[0].base_currency
+        logger.warning(f'Deleting existing {base} data for {hour_key} due to force_overwrite')
+        cursor.execute(f'DELETE FROM {table} WHERE hour = ? AND base_currency = ?', (hour_key, base))
+
+    records_to_insert = [
+        (
+            record.base_currency,
+            record.target_currency,
+            record.rate,
+            snapshot.strftime(DAILY_KEY_FORMAT),
+            hour_key,
+            timestamp,
+        )
+        for record in transformed_data
+    ]
+
+    verb = 'INSERT' if force_overwrite else 'INSERT OR IGNORE'
+    cursor.executemany(
+        f'{verb} INTO {table} (base_currency, target_currency, rate, date, hour, timestamp) VALUES (?, ?, ?, ?, ?, ?)',
+        records_to_insert,
+    )
+    return len(records_to_insert) if force_overwrite else cursor.rowcount
+
+
+def load_data(  # noqa: PLR0913
     transformed_data: list[ExchangeRateRecord],
     db_path: str,
     date_str: str,
     force_overwrite: bool = False,
     dry_run: bool = False,
+    granularity: str = GRANULARITY_DAILY,
+    provider: str | None = None,
 ) -> int:
-    """Load transformed data (Pydantic models) into the database."""
+    """Load transformed data (Pydantic models) into the database.
+
+    All records must share one base currency. Daily data goes to `exchange_rates` (only the changed rates in
+    the `changes` storage mode, see `currensee.delta`), hourly snapshots to the monthly partition matching
+    their timestamp. `provider` is the source recorded in the staged file: a day loaded from a secondary
+    provider is replaced once the primary provider's data for it is loaded.
+    """
     if not transformed_data:
         logger.info(f'No transformed data to load for {date_str}')
         return 0
@@ -157,31 +396,10 @@ def load_data(
     try:
         conn.execute('BEGIN TRANSACTION')
 
-        if force_overwrite:
-            logger.warning(f'Deleting existing data for {date_str} due to force_overwrite')
-            cursor.execute('DELETE FROM exchange_rates WHERE date = ?', (date_str,))
-
-        records_to_insert = [
-            (
-                record.base_currency,
-                record.target_currency,
-                record.rate,
-                record.record_date.strftime('%Y-%m-%d'),
-            )
-            for record in transformed_data
-        ]
-
-        sql = (
-            'INSERT INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)'
-            if force_overwrite
-            else 'INSERT OR IGNORE INTO exchange_rates (base_currency, target_currency, rate, date) VALUES (?, ?, ?, ?)'
-        )
-
-        cursor.executemany(sql, records_to_insert)
-        rows_affected = cursor.rowcount
-
-        if force_overwrite:
-            rows_affected = len(records_to_insert)
+        if granularity == GRANULARITY_HOURLY:
+            rows_affected = _insert_hourly(cursor, transformed_data, force_overwrite)
+        else:
+            rows_affected = _insert_daily(cursor, transformed_data, date_str, force_overwrite, provider)
 
         conn.commit()
         logger.debug(f'Committed {rows_affected} records for {date_str}')
@@ -206,67 +424,90 @@ def run_transform_load(
     options: ExecutionOptions,
     storage_writer: LocalStorageWriter | None = None,
     db_path_str: str | None = None,
-) -> dict[str, int]:
-    if storage_writer is None:
-        storage_writer = LocalStorageWriter()
+    selection: RateSelection | None = None,
+) -> dict[tuple[str, str], int]:
+    """Transform and load every staged (base currency, period key) pair in the date range.
 
+    A custom `storage_writer` can only be used with a single base currency.
+    """
     settings = get_settings()
     db_path = db_path_str or settings.db_path
+    selection = selection or RateSelection()
+    base_currencies = selection.base_currencies or settings.base_currencies
+    if storage_writer is not None and len(base_currencies) > 1:
+        raise ValueError('A custom storage writer can only be used with a single base currency')
 
     if not options.dry_run:
         init_database(db_path)
 
-    dates_to_process = date_range(date_range_obj.start_date, date_range_obj.end_date)
-    result: dict[str, int] = {}
+    keys = period_keys(date_range(date_range_obj.start_date, date_range_obj.end_date), selection.granularity)
+    result: dict[tuple[str, str], int] = {}
 
-    for current_date in dates_to_process:
-        date_str = current_date.strftime('%Y-%m-%d')
+    for base in base_currencies:
+        writer = storage_writer or LocalStorageWriter.for_granularity(selection.granularity, base)
 
-        try:
-            raw_file_path = Path(storage_writer.get_path(date_str))
-            if not raw_file_path.exists():
-                logger.warning(f'No raw data file found for {date_str} at {raw_file_path}, skipping...')
-                result[date_str] = 0
-                continue
-
-            logger.info(f'Processing data for {date_str}')
-            raw_data = read_raw_data(date_str, storage_writer)
-            transformed_data = transform_data(raw_data)
-
-            if not transformed_data and not options.dry_run:
-                logger.info(f'No valid rates transformed for {date_str}, skipping load.')
-                result[date_str] = 0
-                continue
-
-            rows_affected = load_data(
-                transformed_data=transformed_data,
-                db_path=db_path,
-                date_str=date_str,
-                force_overwrite=options.force_overwrite,
-                dry_run=options.dry_run,
-            )
-
-            result[date_str] = rows_affected
-            if not options.dry_run:
-                logger.info(f'Successfully processed {rows_affected} records for {date_str}')
-
-        except FileNotFoundError:
-            logger.warning(f'Raw data file disappeared for {date_str} between check and read, skipping...')
-            result[date_str] = 0
-        except ValueError as e:
-            logger.error(f'Data validation or processing error for {date_str}: {e}')
-            if not options.dry_run:
-                raise
-        except Exception as e:
-            logger.exception(f'Failed to process {date_str}: {e}')
-            if not options.dry_run:
-                raise
+        for key in keys:
+            result[(base, key)] = _transform_load_key(writer, key, selection.granularity, db_path, options)
 
     return result
 
 
+def _transform_load_key(
+    storage_writer: LocalStorageWriter,
+    key: str,
+    granularity: str,
+    db_path: str,
+    options: ExecutionOptions,
+) -> int:
+    label = f'{key} ({storage_writer.base_currency})'
+
+    try:
+        raw_file_path = Path(storage_writer.get_path(key))
+        if not raw_file_path.exists():
+            # Hourly snapshots are only taken when scheduled, so missing hours are expected
+            log = logger.debug if granularity == GRANULARITY_HOURLY else logger.warning
+            log(f'No raw data file found for {label} at {raw_file_path}, skipping...')
+            return 0
+
+        logger.info(f'Processing data for {label}')
+        raw_data = read_raw_data(key, storage_writer)
+        transformed_data = transform_data(raw_data)
+
+        if not transformed_data and not options.dry_run:
+            logger.info(f'No valid rates transformed for {label}, skipping load.')
+            return 0
+
+        rows_affected = load_data(
+            transformed_data=transformed_data,
+            db_path=db_path,
+            date_str=key,
+            force_overwrite=options.force_overwrite,
+            dry_run=options.dry_run,
+            granularity=granularity,
+            provider=raw_data.get('provider'),
+        )
+
+        if not options.dry_run:
+            logger.info(f'Successfully processed {rows_affected} records for {label}')
+        return rows_affected
+
+    except FileNotFoundError:
+        logger.warning(f'Raw data file disappeared for {label} between check and read, skipping...')
+        return 0
+    except ValueError as e:
+        logger.error(f'Data validation or processing error for {label}: {e}')
+        if not options.dry_run:
+            raise
+    except Exception as e:
+        logger.exception(f'Failed to process {label}: {e}')
+        if not options.dry_run:
+            raise
+
+    return 0
+
+
 @app.command()
-def main(
+def main(  # noqa: PLR0913
     date_from: Annotated[
         Optional[datetime],  # noqa: UP007
         typer.Option(formats=['%Y-%m-%d'], help='Start date in YYYY-MM-DD format. Required if --date-to is set.'),
@@ -285,12 +526,23 @@ def main(
     force_overwrite: Annotated[
         bool, typer.Option('--force-overwrite', help='Overwrite existing data in the database for the specified dates.')
     ] = False,
+    base: Annotated[
+        Optional[list[str]],  # noqa: UP007
+        typer.Option('--base', help='Base currency to load, can be repeated (default: from config).'),
+    ] = None,
+    granularity: Annotated[
+        str, typer.Option('--granularity', help='Either "daily" or "hourly" (all hours of the given dates).')
+    ] = GRANULARITY_DAILY,
 ) -> None:
     """Transform raw data and load it into the database for a given date range.
 
     If no dates are provided, defaults to today's date for both start and end.
     If either --date-from or --date-to is provided, both must be specified.
     """
+    if granularity not in GRANULARITIES:
+        logger.error(f'Unknown granularity {granularity!r}, expected one of {", ".join(GRANULARITIES)}.')
+        raise typer.Exit(code=1)
+
     if date_from is None and date_to is None:
         today_date = date.today()
         date_from_date = today_date
@@ -314,15 +566,19 @@ def main(
         date_range_obj=date_range_obj,
         options=options,
         db_path_str=db_path,
+        selection=RateSelection(
+            base_currencies=[b.upper() for b in base] if base else None,
+            granularity=granularity,
+        ),
     )
 
     total_records = sum(result.values())
-    processed_dates_count = len(result)
+    processed_periods_count = len(result)
 
     if dry_run:
-        logger.info(f'[DRY RUN] Would process {total_records} record(s) for {processed_dates_count} date(s)')
+        logger.info(f'[DRY RUN] Would process {total_records} record(s) for {processed_periods_count} period(s)')
     else:
-        logger.info(f'Successfully processed {total_records} record(s) for {processed_dates_count} date(s)')
+        logger.info(f'Successfully processed {total_records} record(s) for {processed_periods_count} period(s)')
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
 import json
+import sqlite3
+import time
 from datetime import date, datetime
 from pathlib import Path
 
+import numpy as np
 import pytest
 
+from currensee.bulk_import import LAYOUT_WIDE, ImportOptions, run_import
 from currensee.constants import (
     API_BASE,
     API_RATES,
@@ -13,10 +17,15 @@ from currensee.constants import (
     RATE,
     TARGET_CURRENCY,
 )
-from currensee.extract import date_range
+from currensee.delta import STORAGE_CHANGES, compact
+from currensee.extract import date_range, period_keys, run_extraction
 from currensee.models import ExchangeRateRecord, OpenExchangeRatesResponse
+from currensee.providers import FRANKFURTER, OPEN_EXCHANGE_RATES, FrankfurterClient, HedgedProvider, StubProvider
+from currensee.quality import KIND_JUMP, KIND_STALE, ScanOptions, log_returns, run_scan, stale_runs
+from currensee.query import RateQuery
+from currensee.rollups import get_rollups, rebuild_rollups
 from currensee.storage import LocalStorageWriter
-from currensee.transform_load import transform_data
+from currensee.transform_load import init_database, load_data, transform_data
 
 USD_CURRENCY = 'USD'
 EUR_CURRENCY = 'EUR'
@@ -27,6 +36,18 @@ TEST_RATE_JPY = 115.5
 TEST_TIMESTAMP = 1744704000  # 2025-04-15
 TEST_DATE_COUNT = 5
 TEST_RECORD_COUNT = 3
+HOURS_PER_DAY = 24
+APRIL_LOW = 0.80
+APRIL_HIGH = 0.85
+MAY_RATE = 0.70
+SLOW_PROVIDER_DELAY = 0.5
+STALLED_PROVIDER_DELAY = 1.0
+HEDGE_AFTER = 0.05
+HEDGED_REQUESTS = 12
+CHANGE_EPSILON = 1e-4
+SCAN_DAYS = 90
+SPIKE_DAY = 60
+STALE_FROM_DAY = 75
 
 
 class TestModels:
@@ -89,6 +110,18 @@ class TestDateRange:
         with pytest.raises(ValueError):
             date_range(end, start)  # end before start
 
+    def test_period_keys(self):
+        day = date(2025, 4, 15)
+        assert period_keys([day]) == ['2025-04-15']
+
+        hourly = period_keys([day], 'hourly')
+        assert len(hourly) == HOURS_PER_DAY
+        assert hourly[0] == '2025-04-15T00'
+        assert hourly[-1] == '2025-04-15T23'
+
+        with pytest.raises(ValueError):
+            period_keys([day], 'weekly')
+
 
 class TestStorage:
     @pytest.fixture
@@ -127,6 +160,132 @@ class TestStorage:
             new_data = json.load(f)
         assert new_data == {'new': 'data'}
 
+    def test_storage_write_is_atomic(self, tmp_path):
+        writer = LocalStorageWriter(base_path=str(tmp_path), stage_dir='stage/test', fsync='batch')
+        path = writer.write({'test': 'data'}, '2025-04-15')
+        writer.flush()
+
+        # Only the final file is left behind, no temporary files
+        assert [p.name for p in Path(path).parent.iterdir()] == ['2025-04-15.json']
+
+        with pytest.raises(ValueError):
+            LocalStorageWriter(base_path=str(tmp_path), stage_dir='stage/test', fsync='sometimes')
+
+    def test_storage_path_per_base_currency(self, tmp_path):
+        usd_writer = LocalStorageWriter(base_path=str(tmp_path), stage_dir='stage/test')
+        eur_writer = LocalStorageWriter(base_path=str(tmp_path), stage_dir='stage/test', base_currency=EUR_CURRENCY)
+
+        assert usd_writer.get_path('2025-04-15') == str(tmp_path / 'stage/test/2025-04-15.json')
+        assert eur_writer.get_path('2025-04-15') == str(tmp_path / 'stage/test/EUR/2025-04-15.json')
+
+    def test_storage_lock(self, mock_storage_writer):
+        date_str = '2025-04-15'
+        with mock_storage_writer.lock(date_str) as acquired:
+            assert acquired
+            with mock_storage_writer.lock(date_str) as acquired_again:
+                assert not acquired_again
+            with mock_storage_writer.lock('2025-04-16') as other_date:
+                assert other_date
+
+        with mock_storage_writer.lock(date_str) as acquired:
+            assert acquired
+
+    def test_storage_lock_cleans_up(self, mock_storage_writer):
+        date_str = '2025-04-15'
+        stage = Path(mock_storage_writer.get_path(date_str)).parent
+        stage.mkdir(parents=True)
+        (stage / f'.{date_str}.abc123.tmp').write_text('{"partial')  # left by a killed writer
+        (stage / '.2025-04-16.abc123.tmp').write_text('{"partial')
+
+        with mock_storage_writer.lock(date_str) as acquired:
+            assert acquired
+            mock_storage_writer.write({'test': 'data'}, date_str)
+
+        # Only the other date's temporary file is left, it may still be written to
+        assert sorted(p.name for p in stage.iterdir()) == ['.2025-04-16.abc123.tmp', f'{date_str}.json']
+
+
+class TestProviders:
+    def test_frankfurter_latest_is_stamped_with_fetch_time(self, monkeypatch):
+        published = {'date': '2025-04-11', 'base': USD_CURRENCY, 'rates': {EUR_CURRENCY: TEST_RATE_EUR}}
+        monkeypatch.setattr('currensee.providers._get_json', lambda *args: published)
+
+        before = int(time.time())
+        response = FrankfurterClient().get_latest_rates()
+
+        assert before <= response.timestamp <= time.time()
+        assert response.rates == {EUR_CURRENCY: TEST_RATE_EUR, USD_CURRENCY: 1.0}
+        assert response.provider == FRANKFURTER
+
+    def test_hedged_provider_prefers_fast_primary(self):
+        primary = StubProvider('primary', rates={EUR_CURRENCY: TEST_RATE_EUR})
+        secondary = StubProvider('secondary', rates={EUR_CURRENCY: APRIL_LOW})
+        provider = HedgedProvider(primary, secondary, hedge_after=SLOW_PROVIDER_DELAY)
+
+        response = provider.get_exchange_rates('2025-04-15')
+        provider.close()
+
+        assert response.provider == 'primary'
+        assert response.rates[EUR_CURRENCY] == TEST_RATE_EUR
+        assert secondary.calls == 0
+        assert provider.stats['primary'].wins == 1
+
+    def test_hedged_provider_takes_first_response(self):
+        primary = StubProvider('primary', rates={EUR_CURRENCY: TEST_RATE_EUR}, delay=SLOW_PROVIDER_DELAY)
+        secondary = StubProvider('secondary', rates={EUR_CURRENCY: APRIL_LOW})
+        provider = HedgedProvider(primary, secondary, hedge_after=HEDGE_AFTER)
+
+        response = provider.get_exchange_rates('2025-04-15')
+
+        assert response.provider == 'secondary'
+        assert response.date_str == '2025-04-15'
+        assert provider.stats['secondary'].wins == 1
+        assert provider.stats['secondary'].max_latency < SLOW_PROVIDER_DELAY
+        provider.close()
+
+    def test_hedged_provider_doesnt_queue_behind_slow_primary(self):
+        primary = StubProvider('primary', delay=STALLED_PROVIDER_DELAY)
+        secondary = StubProvider('secondary')
+        provider = HedgedProvider(primary, secondary, hedge_after=HEDGE_AFTER)
+
+        # More requests than the pool has threads, all of them left with a stalled primary request
+        for day in range(1, HEDGED_REQUESTS + 1):
+            started = time.monotonic()
+            assert provider.get_exchange_rates(f'2025-04-{day:02d}').provider == 'secondary'
+            assert time.monotonic() - started < SLOW_PROVIDER_DELAY
+        provider.close()
+
+    def test_hedged_provider_falls_back_on_error(self, tmp_path):
+        primary = StubProvider('primary', error=ValueError('API request failed'))
+        secondary = StubProvider('secondary', rates={EUR_CURRENCY: APRIL_LOW})
+        provider = HedgedProvider(primary, secondary, hedge_after=SLOW_PROVIDER_DELAY)
+        writer = LocalStorageWriter(base_path=str(tmp_path), stage_dir='stage/test')
+
+        result = run_extraction(date(2025, 4, 14), date(2025, 4, 15), storage_writer=writer, provider=provider)
+
+        assert set(result) == {(USD_CURRENCY, '2025-04-14'), (USD_CURRENCY, '2025-04-15')}
+        staged = json.loads(Path(writer.get_path('2025-04-15')).read_text())
+        assert staged['provider'] == 'secondary'
+        assert provider.stats['primary'].errors == len(result)
+
+        provider.close()
+
+        # Once the primary answers again, the days staged from the secondary are fetched again
+        recovered = StubProvider(OPEN_EXCHANGE_RATES)
+        run_extraction(date(2025, 4, 14), date(2025, 4, 15), storage_writer=writer, provider=recovered)
+        staged = json.loads(Path(writer.get_path('2025-04-15')).read_text())
+        assert staged['provider'] == OPEN_EXCHANGE_RATES
+        assert recovered.calls == len(result)
+        run_extraction(date(2025, 4, 14), date(2025, 4, 15), storage_writer=writer, provider=recovered)
+        assert recovered.calls == len(result)
+
+        failing = HedgedProvider(
+            primary, StubProvider('secondary', error=ValueError('timeout')), hedge_after=HEDGE_AFTER
+        )
+        with pytest.raises(ValueError, match='All providers failed'):
+            failing.get_exchange_rates('2025-04-15')
+        failing.close()
+
 
 class TestTransform:
     def test_transform_data(self):
@@ -149,3 +308,424 @@ class TestTransform:
         assert eur_record.base_currency == USD_CURRENCY
         assert eur_record.rate == TEST_RATE_EUR
         assert eur_record.record_date == datetime.fromtimestamp(TEST_TIMESTAMP).date()
+
+
+class TestLoad:
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        path = str(tmp_path / 'exchange_rates.db')
+        init_database(path)
+        return path
+
+    @staticmethod
+    def _records(base, rates, timestamp=TEST_TIMESTAMP):
+        return transform_data({API_BASE: base, API_TIMESTAMP: timestamp, API_RATES: rates, DATE: '2025-04-15'})
+
+    def test_load_daily_multiple_bases(self, db_path):
+        date_str = '2025-04-15'
+        load_data(self._records(USD_CURRENCY, {EUR_CURRENCY: TEST_RATE_EUR}), db_path, date_str)
+        load_data(self._records(EUR_CURRENCY, {USD_CURRENCY: 1 / TEST_RATE_EUR}), db_path, date_str)
+
+        # Overwriting one base must not touch the other one
+        load_data(self._records(USD_CURRENCY, {EUR_CURRENCY: 0.9}), db_path, date_str, force_overwrite=True)
+
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute('SELECT base_currency, rate FROM exchange_rates ORDER BY base_currency').fetchall()
+        assert rows == [(EUR_CURRENCY, 1 / TEST_RATE_EUR), (USD_CURRENCY, 0.9)]
+
+    def test_load_maintains_rollups(self, db_path):
+        def load(date_str, rate, force_overwrite=False):
+            records = transform_data({API_BASE: USD_CURRENCY, API_RATES: {EUR_CURRENCY: rate}, DATE: date_str})
+            load_data(records, db_path, date_str, force_overwrite=force_overwrite)
+
+        load('2025-04-14', APRIL_LOW)
+        load('2025-04-15', 0.90)
+        load('2025-04-15', 0.95)  # already loaded, ignored
+        load('2025-05-01', MAY_RATE)
+        load('2025-04-15', APRIL_HIGH, force_overwrite=True)  # replaces the April maximum
+
+        def snapshot():
+            with sqlite3.connect(db_path) as conn:
+                return [
+                    conn.execute(
+                        f'SELECT period, ROUND(rate_sum, 9), rate_count, rate_min, rate_max, last_date, last_rate '
+                        f'FROM {table} ORDER BY period'
+                    ).fetchall()
+                    for table in ('exchange_rates_monthly', 'exchange_rates_yearly')
+                ]
+
+        incremental = snapshot()
+        rebuild_rollups(db_path)
+        assert snapshot() == incremental
+
+        april, may = get_rollups(EUR_CURRENCY, db_path=db_path)
+        assert april.period == '2025-04'
+        assert april.average == pytest.approx((APRIL_LOW + APRIL_HIGH) / 2)
+        assert (april.minimum, april.maximum, april.end_of_period_rate) == (APRIL_LOW, APRIL_HIGH, APRIL_HIGH)
+        assert may.count == 1
+
+        (quarter,) = get_rollups(EUR_CURRENCY, period='quarterly', db_path=db_path)
+        assert quarter.period == '2025-Q2'
+        assert quarter.minimum == MAY_RATE
+        assert quarter.end_of_period_date == '2025-05-01'
+        assert quarter.count == TEST_RECORD_COUNT
+
+        # A range starting or ending mid-quarter still gets the whole quarter
+        for date_from, date_to in ((date(2025, 5, 15), None), (None, date(2025, 4, 20))):
+            (partial,) = get_rollups(EUR_CURRENCY, 'quarterly', date_from, date_to, db_path=db_path)
+            assert partial == quarter
+
+    @pytest.mark.parametrize('storage_mode', ['full', STORAGE_CHANGES])
+    def test_load_replaces_fallback_days(self, tmp_path, monkeypatch, storage_mode):
+        monkeypatch.setenv('STORAGE_MODE', storage_mode)
+        db_path = str(tmp_path / 'exchange_rates.db')
+        init_database(db_path)
+
+        def load(rates, provider):
+            records = transform_data({API_BASE: USD_CURRENCY, API_RATES: rates, DATE: '2025-04-15'})
+            load_data(records, db_path, '2025-04-15', provider=provider)
+
+        load({EUR_CURRENCY: APRIL_LOW}, FRANKFURTER)
+        # The primary provider's data replaces the secondary's without force_overwrite, only once
+        load({EUR_CURRENCY: APRIL_HIGH, 'GBP': TEST_RATE_GBP}, OPEN_EXCHANGE_RATES)
+        load({EUR_CURRENCY: MAY_RATE, 'GBP': TEST_RATE_GBP}, OPEN_EXCHANGE_RATES)
+
+        query = RateQuery(db_path)
+        assert query.get_day(date(2025, 4, 15)) == {EUR_CURRENCY: APRIL_HIGH, 'GBP': TEST_RATE_GBP}
+        query.close()
+        (april,) = get_rollups(EUR_CURRENCY, db_path=db_path)
+        assert (april.count, april.average) == (1, APRIL_HIGH)
+
+    def test_load_hourly_partitions(self, db_path):
+        april = 1744675200 + 13 * 3600  # 2025-04-15T13 UTC
+        may = 1746316800  # 2025-05-04T00 UTC
+        records = transform_data({API_BASE: USD_CURRENCY, API_TIMESTAMP: april, API_RATES: {EUR_CURRENCY: 0.85}})
+        assert load_data(records, db_path, '2025-04-15T13', granularity='hourly') == 1
+        assert load_data(records, db_path, '2025-04-15T13', granularity='hourly') == 0
+        records = transform_data({API_BASE: USD_CURRENCY, API_TIMESTAMP: may, API_RATES: {EUR_CURRENCY: 0.86}})
+        load_data(records, db_path, '2025-05-04T00', granularity='hourly')
+
+        with sqlite3.connect(db_path) as conn:
+            april_rows = conn.execute('SELECT hour, rate FROM exchange_rates_hourly_2025_04').fetchall()
+            all_rows = conn.execute('SELECT hour FROM exchange_rates_hourly ORDER BY hour').fetchall()
+        assert april_rows == [('2025-04-15T13', 0.85)]
+        assert all_rows == [('2025-04-15T13',), ('2025-05-04T00',)]
+
+
+class TestDelta:
+    # (date, EUR, JPY): JPY never changes, EUR jumps on the 15th, is back on the 16th and moves within epsilon after
+    DAYS = (
+        ('2025-04-14', APRIL_LOW, TEST_RATE_JPY),
+        ('2025-04-15', APRIL_HIGH, TEST_RATE_JPY),
+        ('2025-04-16', APRIL_LOW, TEST_RATE_JPY),
+        ('2025-04-17', APRIL_LOW * (1 + CHANGE_EPSILON / 2), TEST_RATE_JPY),
+    )
+
+    @staticmethod
+    def _load(db_path, days, force_overwrite=False):
+        for date_str, eur, jpy in days:
+            rates = {EUR_CURRENCY: eur, 'JPY': jpy}
+            records = transform_data({API_BASE: USD_CURRENCY, API_RATES: rates, DATE: date_str})
+            load_data(records, db_path, date_str, force_overwrite=force_overwrite)
+
+    @staticmethod
+    def _stored(db_path):
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute('SELECT target_currency, date FROM exchange_rates ORDER BY 1, 2').fetchall()
+
+    def test_change_only_load_and_reads(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('STORAGE_MODE', STORAGE_CHANGES)
+        monkeypatch.setenv('CHANGE_EPSILON', str(CHANGE_EPSILON))
+        db_path = str(tmp_path / 'exchange_rates.db')
+        init_database(db_path)
+
+        # Loaded out of order: the 15th must pin the 16th to the rate it had before
+        self._load(db_path, [self.DAYS[0], self.DAYS[2], self.DAYS[1], self.DAYS[3]])
+        assert self._stored(db_path) == [
+            (EUR_CURRENCY, '2025-04-14'),
+            (EUR_CURRENCY, '2025-04-15'),
+            (EUR_CURRENCY, '2025-04-16'),
+            ('JPY', '2025-04-14'),
+        ]
+
+        query = RateQuery(db_path)
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 15)) == APRIL_HIGH
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 17)) == APRIL_LOW
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 18)) is None
+        assert query.get_day(date(2025, 4, 17)) == {EUR_CURRENCY: APRIL_LOW, 'JPY': TEST_RATE_JPY}
+
+        series = query.get_series('JPY', date(2025, 4, 15), date(2025, 4, 20))
+        assert series.dates.tolist() == [date(2025, 4, 15), date(2025, 4, 16), date(2025, 4, 17)]
+        assert series.rates.tolist() == [TEST_RATE_JPY] * 3
+
+        matrix = query.get_matrix(date(2025, 4, 15), date(2025, 4, 18))
+        assert matrix.rates[:3, 0].tolist() == [APRIL_HIGH, APRIL_LOW, APRIL_LOW]
+        assert np.isnan(matrix.rates[3]).all()
+        query.close()
+
+        # Rollups summarize the daily rates, not the stored changes
+        (april,) = get_rollups('JPY', db_path=db_path)
+        assert april.count == len(self.DAYS)
+        rebuild_rollups(db_path)
+        assert get_rollups('JPY', db_path=db_path) == [april]
+
+        self._load(db_path, [('2025-04-15', APRIL_LOW, TEST_RATE_JPY)], force_overwrite=True)
+        (april,) = get_rollups(EUR_CURRENCY, db_path=db_path)
+        assert (april.minimum, april.maximum, april.count) == (APRIL_LOW, APRIL_LOW, len(self.DAYS))
+        rebuild_rollups(db_path)
+        assert get_rollups(EUR_CURRENCY, db_path=db_path) == [april]
+        assert self._stored(db_path) == [(EUR_CURRENCY, '2025-04-14'), ('JPY', '2025-04-14')]
+
+    def test_change_only_rollups_with_missing_currency(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('STORAGE_MODE', STORAGE_CHANGES)
+        db_path = str(tmp_path / 'exchange_rates.db')
+        init_database(db_path)
+
+        def load(date_str, rates, force_overwrite=False):
+            records = transform_data({API_BASE: USD_CURRENCY, API_RATES: rates, DATE: date_str})
+            load_data(records, db_path, date_str, force_overwrite=force_overwrite)
+
+        def snapshot():
+            with sqlite3.connect(db_path) as conn:
+                return conn.execute('SELECT * FROM exchange_rates_monthly ORDER BY 1, 2, 3').fetchall()
+
+        # GBP is missing from the 2nd and carried over from the 1st, the 3rd introduces JPY before a loaded day
+        load('2025-04-01', {EUR_CURRENCY: APRIL_LOW, 'GBP': TEST_RATE_GBP})
+        load('2025-04-04', {EUR_CURRENCY: APRIL_LOW})
+        load('2025-04-02', {EUR_CURRENCY: APRIL_HIGH})
+        load('2025-04-02', {EUR_CURRENCY: APRIL_LOW}, force_overwrite=True)
+        load('2025-04-03', {EUR_CURRENCY: APRIL_LOW, 'JPY': TEST_RATE_JPY})
+
+        incremental = snapshot()
+        rebuild_rollups(db_path)
+        assert snapshot() == incremental
+        (gbp,) = get_rollups('GBP', db_path=db_path)
+        (jpy,) = get_rollups('JPY', db_path=db_path)
+        assert (gbp.count, jpy.count) == (TEST_DATE_COUNT - 1, 2)
+
+    def test_change_only_import_keeps_later_days(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('STORAGE_MODE', STORAGE_CHANGES)
+        db_path = str(tmp_path / 'exchange_rates.db')
+        init_database(db_path)
+        self._load(db_path, [self.DAYS[0], self.DAYS[2]])
+
+        dump = tmp_path / 'rates.csv'
+        dump.write_text(f'date,currency,rate\n2025-04-15,EUR,{APRIL_HIGH}\n')
+        run_import(dump, ImportOptions(), db_path)
+
+        query = RateQuery(db_path)
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 15)) == APRIL_HIGH
+        assert query.get_day(date(2025, 4, 16)) == {EUR_CURRENCY: APRIL_LOW, 'JPY': TEST_RATE_JPY}
+        query.close()
+        # Only the EUR pin is needed, the JPY one repeats the rate before it
+        assert self._stored(db_path) == [
+            (EUR_CURRENCY, '2025-04-14'),
+            (EUR_CURRENCY, '2025-04-15'),
+            (EUR_CURRENCY, '2025-04-16'),
+            ('JPY', '2025-04-14'),
+        ]
+
+    def test_compact_full_database(self, tmp_path):
+        db_path = str(tmp_path / 'exchange_rates.db')
+        init_database(db_path)
+        self._load(db_path, self.DAYS)
+
+        query = RateQuery(db_path)
+        full_matrix = query.get_matrix(date(2025, 4, 14), date(2025, 4, 17))
+
+        # Only the unchanged JPY rates can go without an epsilon
+        assert compact(db_path, epsilon=0.0) == len(self.DAYS) - 1
+        assert len(self._stored(db_path)) == len(self.DAYS) + 1
+
+        # A query opened before the conversion picks up the new storage mode
+        assert np.array_equal(query.get_matrix(date(2025, 4, 14), date(2025, 4, 17)).rates, full_matrix.rates)
+        assert query.get_rate('JPY', date(2025, 4, 17)) == TEST_RATE_JPY
+        query.close()
+
+
+class TestBulkImport:
+    def test_import_long_csv(self, tmp_path):
+        dump = tmp_path / 'rates.csv'
+        dump.write_text(
+            'Date,Base,Currency,Close\n'
+            '2025-04-14,USD,EUR,0.88\n'
+            '2025-04-15 00:00:00,usd,eur,0.87\n'
+            'not-a-date,USD,EUR,0.86\n'
+            '2025-04-15,USD,EURO,0.86\n'
+            '2025-04-15,USD,GBP,-1\n'
+            '1744704000,USD,EUR,0.85\n'  # epoch seconds in a text column, not a year
+            '20250415,USD,EUR,0.85\n'
+            '2025-13-01,USD,EUR,0.85\n'
+            '2525-04-15,USD,EUR,0.85\n'
+        )
+        db_path = str(tmp_path / 'exchange_rates.db')
+
+        stats = run_import(dump, ImportOptions(chunk_size=2), db_path)
+        assert (stats.rows_read, stats.rows_invalid, stats.rows_loaded) == (9, 7, 2)
+        assert (stats.date_from, stats.date_to) == ('2025-04-14', '2025-04-15')
+
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute('SELECT base_currency, target_currency, rate, date FROM exchange_rates').fetchall()
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert rows == [
+            (USD_CURRENCY, EUR_CURRENCY, 0.88, '2025-04-14'),
+            (USD_CURRENCY, EUR_CURRENCY, 0.87, '2025-04-15'),
+        ]
+        assert {'idx_exchange_rates_date', 'idx_exchange_rates_currencies'} <= indexes
+
+        (april,) = get_rollups(EUR_CURRENCY, db_path=db_path)
+        assert april.end_of_period_rate == pytest.approx(0.87)
+
+        with pytest.raises(ValueError):
+            run_import(dump, ImportOptions(strict=True), db_path)
+
+    def test_import_parquet(self, tmp_path):
+        pa = pytest.importorskip('pyarrow')
+        pq = pytest.importorskip('pyarrow.parquet')
+        dump = tmp_path / 'rates.parquet'
+        rates = [0.88, 0.87, -1.0]
+        pq.write_table(
+            pa.table(
+                {
+                    'date': pa.array([date(2025, 4, 14), date(2025, 4, 15), date(2025, 4, 15)], pa.date32()),
+                    'currency': ['EUR', 'EUR', 'GBP'],
+                    'rate': rates,
+                }
+            ),
+            dump,
+        )
+        db_path = str(tmp_path / 'exchange_rates.db')
+
+        stats = run_import(dump, ImportOptions(chunk_size=2), db_path)
+        assert (stats.rows_read, stats.rows_invalid, stats.rows_loaded) == (3, 1, 2)
+        assert (stats.date_from, stats.date_to) == ('2025-04-14', '2025-04-15')
+
+        # Numeric date columns are epoch seconds
+        epochs = tmp_path / 'epochs.parquet'
+        pq.write_table(pa.table({'timestamp': [TEST_TIMESTAMP], 'currency': ['GBP'], 'rate': [TEST_RATE_GBP]}), epochs)
+        run_import(epochs, ImportOptions(), db_path)
+
+        query = RateQuery(db_path)
+        assert query.get_day(date(2025, 4, 15)) == {EUR_CURRENCY: rates[1], 'GBP': TEST_RATE_GBP}
+        query.close()
+
+    def test_import_wide_csv(self, tmp_path):
+        dump = tmp_path / 'rates.csv'
+        dump.write_text('date,EUR,GBP\n2025-04-14,0.88,0.76\n2025-04-15,,0.75\n')
+        db_path = str(tmp_path / 'exchange_rates.db')
+
+        stats = run_import(dump, ImportOptions(layout=LAYOUT_WIDE, base_currency=EUR_CURRENCY), db_path)
+        assert (stats.rows_read, stats.rows_invalid, stats.rows_loaded) == (3, 0, 3)
+
+        stats = run_import(dump, ImportOptions(layout=LAYOUT_WIDE, dry_run=True), str(tmp_path / 'missing.db'))
+        assert stats.rows_loaded == TEST_RECORD_COUNT
+        assert not (tmp_path / 'missing.db').exists()
+
+
+class TestQuery:
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        path = str(tmp_path / 'exchange_rates.db')
+        init_database(path)
+        for date_str, rates in (
+            ('2025-04-14', {EUR_CURRENCY: 0.88, 'GBP': TEST_RATE_GBP}),
+            ('2025-04-16', {EUR_CURRENCY: TEST_RATE_EUR}),
+        ):
+            records = transform_data({API_BASE: USD_CURRENCY, API_RATES: rates, DATE: date_str})
+            load_data(records, path, date_str)
+        return path
+
+    def test_point_lookups(self, db_path):
+        query = RateQuery(db_path)
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 16)) == TEST_RATE_EUR
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 15)) is None
+        assert query.get_day(date(2025, 4, 14)) == {EUR_CURRENCY: 0.88, 'GBP': TEST_RATE_GBP}
+
+        with pytest.raises(sqlite3.OperationalError):
+            with query.pool.connection() as conn:
+                conn.execute('DELETE FROM exchange_rates')
+        query.close()
+
+    def test_series_and_matrix(self, db_path):
+        query = RateQuery(db_path)
+        series = query.get_series(EUR_CURRENCY, date(2025, 4, 1), date(2025, 4, 30))
+        assert series.dates.tolist() == [date(2025, 4, 14), date(2025, 4, 16)]
+        assert series.rates.tolist() == [0.88, TEST_RATE_EUR]
+
+        matrix = query.get_matrix(date(2025, 4, 14), date(2025, 4, 16))
+        assert matrix.currencies == [EUR_CURRENCY, 'GBP']
+        assert matrix.rates.shape == (3, 2)
+        assert matrix.rates[2].tolist()[0] == TEST_RATE_EUR
+        assert np.isnan(matrix.rates[1]).all()
+
+    def test_series_to_arrow(self, db_path):
+        pytest.importorskip('pyarrow')
+        query = RateQuery(db_path)
+        table = query.get_series(EUR_CURRENCY, date(2025, 4, 1), date(2025, 4, 30)).to_arrow()
+        query.close()
+
+        assert table.column_names == ['date', 'rate']
+        assert table.column('date').to_pylist() == [date(2025, 4, 14), date(2025, 4, 16)]
+        assert table.column('rate').to_pylist() == [0.88, TEST_RATE_EUR]
+
+    def test_reads_during_load(self, db_path):
+        query = RateQuery(db_path)
+        writer = sqlite3.connect(db_path, isolation_level=None)
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("DELETE FROM exchange_rates WHERE date = '2025-04-16'")
+
+        # The uncommitted load neither blocks readers nor leaks into their results
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 16)) == TEST_RATE_EUR
+
+        writer.execute('COMMIT')
+        writer.close()
+        assert query.get_rate(EUR_CURRENCY, date(2025, 4, 16)) is None
+
+
+class TestQuality:
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        # EUR and GBP random walks, EUR spikes on day 60 and JPY stops moving from day 75
+        rng = np.random.default_rng(0)
+        walks = TEST_RATE_EUR * np.exp(np.cumsum(rng.normal(0, 0.002, (SCAN_DAYS, 3)), axis=0))
+        walks[SPIKE_DAY, 0] *= 1.1
+        walks[STALE_FROM_DAY:, 2] = walks[STALE_FROM_DAY, 2]
+
+        path = str(tmp_path / 'exchange_rates.db')
+        init_database(path)
+        for day in range(SCAN_DAYS):
+            date_str = date.fromordinal(date(2025, 1, 1).toordinal() + day).isoformat()
+            rates = dict(zip((EUR_CURRENCY, 'GBP', 'JPY'), walks[day].tolist(), strict=True))
+            load_data(transform_data({API_BASE: USD_CURRENCY, API_RATES: rates, DATE: date_str}), path, date_str)
+        return path
+
+    def test_returns_and_stale_runs(self):
+        rates = np.array([[1.0], [np.e], [np.nan], [np.e], [np.e]])
+        returns = log_returns(rates)
+        assert np.isnan(returns[[0, 2], 0]).all()
+        assert returns[[1, 3, 4], 0].tolist() == [1.0, 0.0, 0.0]
+        assert stale_runs(returns)[:, 0].tolist() == [0, 0, 0, 1, 2]
+
+        # Moves within the tolerance (e.g. CHANGE_EPSILON of change-only storage) count as unchanged
+        drifting = log_returns(np.array([[1.0], [1.0 + CHANGE_EPSILON / 2], [1.0 + CHANGE_EPSILON * 2]]))
+        assert stale_runs(drifting)[:, 0].tolist() == [0, 0, 0]
+        assert stale_runs(drifting, CHANGE_EPSILON)[:, 0].tolist() == [0, 1, 0]
+
+    def test_scan_flags_jumps_and_stale_rates(self, db_path):
+        anomalies = run_scan(date(2025, 2, 1), date(2025, 3, 31), ScanOptions(stale_days=5), db_path_str=db_path)
+
+        flagged = {(a.kind, a.target_currency, a.date) for a in anomalies}
+        assert (KIND_JUMP, EUR_CURRENCY, '2025-03-02') in flagged  # day 60
+        assert (KIND_STALE, 'JPY', '2025-03-22') in flagged  # 5th unchanged day after day 75
+        assert {currency for _, currency, _ in flagged} == {EUR_CURRENCY, 'JPY'}
+
+        with sqlite3.connect(db_path) as conn:
+            stored = conn.execute('SELECT kind, target_currency, date FROM anomalies').fetchall()
+        assert set(stored) == flagged
+
+        # A re-scan replaces the results, excluded currencies are skipped
+        options = ScanOptions(stale_days=5, exclude=['JPY'])
+        run_scan(date(2025, 2, 1), date(2025, 3, 31), options, db_path_str=db_path)
+        with sqlite3.connect(db_path) as conn:
+            stored = conn.execute('SELECT DISTINCT target_currency FROM anomalies').fetchall()
+        assert stored == [(EUR_CURRENCY,)]